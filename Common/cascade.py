@@ -0,0 +1,112 @@
+from typing import Any, Callable, Dict, Sequence, Tuple
+import threading
+import logging
+import time
+
+# shared by Part_1 and Part_2 - standard library only, no Core imports (each part has its own)
+
+logger = logging.getLogger(__name__)
+
+
+class Cascade:
+
+    # tiers: (model name, call) from fastest / cheapest to largest
+    # call(*args) -> (output, usage) - usage is {"prompt_tokens", "completion_tokens", "cached_tokens"} or None
+    # accept(output) -> bool - cheap checks; a failed check (or an error) escalates to the next tier
+    def __init__(self, name: str, tiers: Sequence[Tuple[str, Callable]], accept: Callable[[Any], bool], pricing: Dict[str, Dict[str, float]] | None = None):
+
+        if not tiers:
+            raise ValueError(f"Cascade {name} needs at least one tier")
+
+        self.name = name
+        self.tiers = list(tiers)
+        self.accept = accept
+        self.pricing = pricing or {}  # model -> {"prompt", "cached_prompt", "completion"}: $ per 1K tokens
+        self.lock = threading.Lock()
+
+        self.stats = {
+            model: {
+                "calls": 0, "accepted": 0, "escalated": 0, "errors": 0,
+                "total_ms": 0.0, "max_ms": 0.0,
+                "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+            }
+            for model, _ in self.tiers
+        }
+
+    # ------------- main functionality ----------------------------------
+
+    def run(self, *args, **kwargs) -> Any:
+
+        for level, (model, call) in enumerate(self.tiers):
+
+            last = level == len(self.tiers) - 1
+            start = time.perf_counter()
+
+            try:
+                output, usage = call(*args, **kwargs)
+            except Exception as e:
+                self.record(model, start, None, "errors")
+                if last:
+                    raise
+                logger.warning(f"{self.name}: {model} failed ({str(e)}), escalating")
+                continue
+
+            passed = self.check(output)
+
+            # the last tier's answer is returned either way - there is nothing left to try
+            self.record(model, start, usage, "accepted" if passed else "escalated" if not last else None)
+
+            if passed or last:
+                return output
+
+            logger.info(f"{self.name}: {model} output failed checks, escalating")
+
+    def check(self, output: Any) -> bool:
+
+        try:
+            return bool(self.accept(output))
+        except Exception as e:
+            logger.warning(f"{self.name}: check raised {str(e)}")
+            return False
+
+    # ------------- stats -------------------------------------------
+
+    def record(self, model: str, start: float, usage: Dict | None, outcome: str | None):
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        usage = usage or {}
+        prices = self.pricing.get(model, {})
+
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        completion_tokens = usage.get("completion_tokens", 0) or 0
+        cached_tokens = usage.get("cached_tokens", 0) or 0  # part of prompt_tokens, billed at the cached rate
+
+        with self.lock:
+
+            stats = self.stats[model]
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_prompt_tokens"] += cached_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cost"] += (
+                (prompt_tokens - cached_tokens) / 1000 * prices.get("prompt", 0)
+                + cached_tokens / 1000 * prices.get("cached_prompt", prices.get("prompt", 0))
+                + completion_tokens / 1000 * prices.get("completion", 0)
+            )
+
+            if outcome:
+                stats[outcome] += 1
+
+    def summary(self) -> Dict[str, Dict]:
+
+        with self.lock:
+            return {
+                model: {
+                    **stats,
+                    "avg_ms": stats["total_ms"] / stats["calls"] if stats["calls"] else 0,
+                    "escalation_rate": stats["escalated"] / stats["calls"] if stats["calls"] else 0,
+                }
+                for model, stats in self.stats.items()
+            }
@@ -16,6 +16,12 @@ openai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 openai_model = "gpt-4o"
 openai_model_mini = "gpt-4o-mini"
 
+# cascade: mini deployment first, openai_model only when the Validator rejects its extraction
+pricing = {
+    "gpt-4o-mini": {"prompt": 0.00015, "cached_prompt": 0.000075, "completion": 0.0006},
+    "gpt-4o": {"prompt": 0.0025, "cached_prompt": 0.00125, "completion": 0.01},
+}
+
 gpt4o_endpoint = os.getenv("GPT4o_ENDPOINT")
 gpt4o_mini_endpoint = os.getenv("GPT4o_MINI_ENDPOINT")
 
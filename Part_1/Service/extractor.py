@@ -1,8 +1,10 @@
 from openai import AzureOpenAI
 import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, Tuple
+from functools import partial
 from Core.schema import Form
+from Common.cascade import Cascade
 import re
 
 from Core.log_config import get_module_logger
@@ -14,7 +16,8 @@ logger = get_module_logger(__name__)
 class Extractor:
 
 
-    def __init__(self, endpoint: str, key: str, version: str, name: str):
+    def __init__(self, endpoint: str, key: str, version: str, name: str, fallback: Optional[str] = None,
+                 accept: Optional[Callable[[Dict], bool]] = None, pricing: Optional[Dict] = None):
 
         self.client = AzureOpenAI(
             azure_endpoint=endpoint,
@@ -23,6 +26,11 @@ class Extractor:
         )
 
         self.name = name
+
+        # name first - fallback (larger deployment) only when accept() rejects the extraction
+        tiers = [(model, partial(self.complete, model)) for model in (name, fallback) if model]
+        self.cascade = Cascade("extraction", tiers, accept or (lambda fields: True), pricing)
+
         logger.info("Extraction Service initialized successfully")
     
     def extract_fields(self, ocr_data: Dict, retry_count: int = 0) -> Dict:
@@ -33,34 +41,19 @@ class Extractor:
         system_prompt = self.system_prompt()
         user_prompt = self.extraction_prompt(ocr_data)
         
-        logger.info("Sending extraction request to GPT-4o")
-        logger.debug(f"Using model: {self.name}")
+        logger.info(f"Sending extraction request (cascade: {[model for model, _ in self.cascade.tiers]})")
         
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
         # -------- infer --------------------------------------
 
         try :
-            response = self.client.chat.completions.create(
-                model=self.name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,  # Low temperature for consistency
-                response_format={"type": "json_object"},
-                max_tokens=2000
-            )
-
-            logger.info("Received response from GPT-4o")
-            logger.debug(f"Response tokens used: {response.usage.total_tokens if hasattr(response, 'usage') else 'N/A'}")
-            
-            extracted = json.loads(response.choices[0].message.content)
-            logger.info("Successfully parsed JSON response")
-            
-            cleaned = self.clean(extracted)
-            logger.info("Data cleaning completed successfully")
-            
+            fields = self.cascade.run(messages)
             logger.info("Field extraction completed successfully")
-            return cleaned.output()
+            return fields
         
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response: {str(e)}")
@@ -69,6 +62,36 @@ class Extractor:
         except Exception as e:
             logger.error(f"Error during field extraction: {str(e)}", exc_info=True)
             raise
+
+    def complete(self, model: str, messages: list) -> Tuple[Dict, Optional[Dict]]:
+
+        # one cascade tier: model call -> parsed, cleaned fields (+ token usage)
+        logger.debug(f"Using model: {model}")
+
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.1,  # Low temperature for consistency
+            response_format={"type": "json_object"},
+            max_tokens=2000
+        )
+
+        logger.info(f"Received response from {model}")
+        logger.debug(f"Response tokens used: {response.usage.total_tokens if getattr(response, 'usage', None) else 'N/A'}")
+        
+        extracted = json.loads(response.choices[0].message.content)
+        logger.info("Successfully parsed JSON response")
+        
+        cleaned = self.clean(extracted)
+        logger.info("Data cleaning completed successfully")
+
+        usage = {
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+            "cached_tokens": getattr(getattr(response.usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+        } if getattr(response, "usage", None) else None
+
+        return cleaned.output(), usage
             
     # --------------- prompts ------------------------------------------------------------------------------
 
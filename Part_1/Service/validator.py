@@ -451,6 +451,26 @@ class Validator:
         
         return confidence_scores
     
+    def confident(self, data: Dict, threshold: float = 0.8) -> bool:
+
+        # cheap acceptance check for the model cascade - schema + structured-field confidence
+        # (text-field scores are length heuristics, a short name is not a bad extraction)
+        if not self.valid_schema(data)["is_valid"]:
+            return False
+
+        def filled(field):
+            value = data.get(field)
+            return any(value.values()) if isinstance(value, dict) else bool(value)
+
+        # dates left blank on the form are not low confidence (phone scores are keyed by number)
+        scores = self.confidence(data)
+        structured = [
+            score for field, score in scores.items()
+            if field not in self.text_fields and (field not in data or filled(field))
+        ]
+
+        return not structured or min(structured) >= threshold
+
     def section_metrics(self, data: Dict) -> Dict:
         
         # ------ sections ----------------------------------------------------------
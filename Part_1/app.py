@@ -5,9 +5,11 @@ from datetime import datetime
 import pandas as pd
 from pathlib import Path
 import base64
+import sys
 import io
 from PIL import Image
 
+sys.path.append(str(Path(__file__).parent.parent))  # Common/ (shared with Part_2)
 
 from Service.ocr import OCR
 from Service.extractor import Extractor
@@ -34,14 +36,17 @@ def services():
         key=config.doc_int_key
     )
     
+    validator = Validator()
+
     extractor = Extractor(
         endpoint=config.openai_endpoint,
         key=config.openai_key,
         version=config.openai_version,
-        name=config.openai_model
+        name=config.openai_model_mini,
+        fallback=config.openai_model,
+        accept=lambda fields: validator.confident(fields, config.confidence),
+        pricing=config.pricing
     )
-    
-    validator = Validator()
 
     logger.info("All services initialized successfully")
     
@@ -79,6 +84,7 @@ def process(file_content: bytes, file_type: str, filename: str):
             extracted_fields = extractor.extract_fields(ocr_data)
             results["extraction_success"] = True
             results["extracted_data"] = extracted_fields
+            results["model_cascade"] = extractor.cascade.summary()
             logger.info("Field extraction completed successfully")
         
         # -------- validator ----------
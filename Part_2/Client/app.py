@@ -1,5 +1,6 @@
 import gradio as gr
 import requests
+import json
 import os
 import sys
 from datetime import datetime
@@ -12,43 +13,73 @@ from Core.logger_setup import get_logger
 
 logger = get_logger(__name__)
 
+# ------------- server-sent events ----------------------------------
+
+def events(response):
+
+    # (event, data) pairs from a text/event-stream response
+    event, data = "message", []
+
+    for line in response.iter_lines(decode_unicode=True):
+
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 # ------------- chat handler ----------------------------------------
 
-def talk(user_msg, history, user_info_state):
-    
+def talk(user_msg, history, user_info_state, session_id):
+
+    # generator - yields the growing answer, the last yield is the final state
     try:
 
         # ------ input validation (can be enhanced) --------------------------
 
         if not user_msg or not user_msg.strip():
-            return history, "", user_info_state
+            yield history, "", user_info_state, session_id
+            return
         
         # ------ prepare payload ---------------------------------------------
 
-        state = {"history": [], "user_info": user_info_state}
-        
-        for user, assistant in (history or []):
-            if user:  
-                state["history"].append({"role": "user", "content": user})
-                state["history"].append({"role": "assistant", "content": assistant})
-        
-
+        # the server keeps the transcript and user info - only the new message is sent
+        # ("" asks the server to open a new session)
         payload = {
-            "history": state["history"],
-            "user_info": state["user_info"],
+            "session_id": session_id or "",
             "user_msg": user_msg.strip()
         }
         
         logger.info(f"Sending request to backend: {user_msg[:50]}...")
         
-        # ------ call server ---------------------------------------------
+        # ------ call server (streamed) -----------------------------------
 
-        response = requests.post(config.chatbot_server_endpoint, json=payload, timeout=30)
+        # read timeout applies between events, not to the whole answer
+        response = requests.post(config.chatbot_stream_endpoint, json=payload, stream=True, timeout=(10, config.chat_timeout))
         response.raise_for_status()
-        data = response.json()
+
+        partial_msg = ""
+        data = {}
+
+        for event, event_data in events(response):
+
+            if event == "token":
+                partial_msg += event_data["text"]
+                yield (history or []) + [(user_msg, partial_msg)], "", user_info_state, session_id
+
+            elif event == "done":
+                data = event_data
+
+            elif event == "error":
+                raise requests.exceptions.RequestException(event_data.get("detail"))
         
         # ------ process response ---------------------------------------------
 
+        session_id = data.get("session_id", session_id)
+
         if data.get("user_info"):
             user_info_state = data["user_info"]
             logger.info("User info collected successfully")
@@ -58,7 +89,7 @@ def talk(user_msg, history, user_info_state):
         
         logger.info(f"Successfully received response from backend for user: {user_info_state.get('id_number', 'anonymous') if user_info_state else 'anonymous'}")
         
-        return new_history, "", user_info_state
+        yield new_history, "", user_info_state, session_id
     
     # ------ errors ---------------------------------------------
 
@@ -66,25 +97,25 @@ def talk(user_msg, history, user_info_state):
         logger.error("Request timeout")
         error_msg = "הבקשה לקחה יותר מדי זמן. אנא נסה שוב."
         new_history = (history or []) + [(user_msg, error_msg)]
-        return new_history, "", user_info_state
+        yield new_history, "", user_info_state, session_id
         
     except requests.exceptions.ConnectionError:
         logger.error("Connection error to backend")
         error_msg = "לא ניתן להתחבר לשרת. אנא וודא שהשרת פועל."
         new_history = (history or []) + [(user_msg, error_msg)]
-        return new_history, "", user_info_state
+        yield new_history, "", user_info_state, session_id
         
     except requests.exceptions.RequestException as e:
         logger.error(f"Backend error: {str(e)}")
         error_msg = "מצטער, יש בעיה בחיבור לשרת. אנא נסה שוב."
         new_history = (history or []) + [(user_msg, error_msg)]
-        return new_history, "", user_info_state
+        yield new_history, "", user_info_state, session_id
         
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         error_msg = "אירעה שגיאה לא צפויה. אנא נסה שוב."
         new_history = (history or []) + [(user_msg, error_msg)]
-        return new_history, "", user_info_state
+        yield new_history, "", user_info_state, session_id
 
 # ------------- main ui ---------------------------------------------
 
@@ -127,6 +158,7 @@ def main():
         # ---------- State ---------------------------------------------------
 
         user_info_state = gr.State(None)
+        session_state = gr.State(None)
 
         # ---------- Phase Indicator -----------------------------------------
 
@@ -167,24 +199,25 @@ def main():
 
         # ---------- Submit Callback -----------------------------------------
 
-        def on_submit(user_msg, history, info):
-            new_hist, _, new_info = talk(user_msg, history, info)
-            phase_html = (
-                '<div class="phase-indicator">מענה על שאלות</div>' if
-                new_info and new_info.get("verified") else
-                '<div class="phase-indicator">אימות פרטים</div>'
-                if new_info else
-                '<div class="phase-indicator">איסוף פרטים אישיים</div>'
-            )
-            return new_hist, "", new_info, phase_html
+        def on_submit(user_msg, history, info, session_id):
+            # re-renders on every streamed chunk
+            for new_hist, _, new_info, new_session in talk(user_msg, history, info, session_id):
+                phase_html = (
+                    '<div class="phase-indicator">מענה על שאלות</div>' if
+                    new_info and new_info.get("verified") else
+                    '<div class="phase-indicator">אימות פרטים</div>'
+                    if new_info else
+                    '<div class="phase-indicator">איסוף פרטים אישיים</div>'
+                )
+                yield new_hist, "", new_info, new_session, phase_html
 
         submit_btn.click(on_submit,
-                         [textbox, chatbot, user_info_state],
-                         [chatbot, textbox, user_info_state, phase_indicator])
+                         [textbox, chatbot, user_info_state, session_state],
+                         [chatbot, textbox, user_info_state, session_state, phase_indicator])
 
         textbox.submit(on_submit,
-                       [textbox, chatbot, user_info_state],
-                       [chatbot, textbox, user_info_state, phase_indicator])
+                       [textbox, chatbot, user_info_state, session_state],
+                       [chatbot, textbox, user_info_state, session_state, phase_indicator])
 
         # ---------- Footer --------------------------------------------------
         
@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,6 +18,64 @@ openai_model = "gpt-4o"
 openai_model_mini = "gpt-4o-mini"
 openai_emb = "text-embedding-ada-002"
 
+# ----- admin ----------------------------------------------------------------
+
+admin_api_key = os.getenv("ADMIN_API_KEY")  # required (X-API-Key header) by /admin routes when set
+
+# ----- RAG ------------------------------------------------------------------
+
+rag_data_dir = "./Data/phase2_data"
+rag_index_dir = str(Path(__file__).parent.parent / "Index")
+rag_chunk_size = 1000
+rag_chunk_overlap = 200
+rag_ingest_workers = min(4, os.cpu_count() or 1)  # HTML parse / chunk processes (1 = in-process)
+rag_ingest_parallel_min_bytes = 8 * 1024 * 1024  # smaller corpora are parsed in-process
+
+rag_embedding_backend = os.getenv("RAG_EMBEDDING_BACKEND", "azure")  # "azure" | "local" (hashed n-grams, CPU only - offline builds, tests, benchmarks)
+rag_local_embedding_dim = 512
+rag_local_embedding_ngrams = (3, 4)  # character n-gram sizes, next to whole (stemmed) words
+rag_local_embedding_batch = 256
+rag_embedding_timeout = 10  # seconds per query embedding
+rag_degraded_mode = True  # slow / failing query embedding - serve BM25 results instead of failing
+
+rag_embedding_batch_size = 64  # chunks per embedding request during index builds
+rag_embedding_workers = 4  # concurrent embedding requests
+rag_embedding_max_retries = 5  # per batch, on 429 only
+rag_embedding_backoff = 1.0  # seconds, doubled per retry (Retry-After wins when sent)
+
+rag_embedding_cache = True
+rag_embedding_cache_dir = str(Path(__file__).parent.parent / "Cache" / "embeddings")
+rag_embedding_cache_batch = 64
+
+rag_cache_max_entries = 1000
+rag_cache_ttl = 3600  # 1 hour
+rag_cache_max_bytes = 16 * 1024 * 1024
+
+semantic_cache_threshold = 0.97  # cosine similarity between questions
+semantic_cache_max_entries = 500  # per HMO / tier scope
+semantic_cache_ttl = 3600
+
+rag_index_type = "flat"  # "flat" (exact) | "ivf_flat" | "hnsw" | "ivf_pq"
+rag_ivf_nlist = 0  # 0 = ~4 * sqrt(number of chunks)
+rag_ivf_nprobe = 8
+rag_hnsw_m = 32
+rag_hnsw_ef_construction = 80
+rag_hnsw_ef_search = 64
+rag_pq_m = 16  # sub-quantizers (must divide the embedding dimension - lowered if not)
+rag_pq_bits = 8
+
+rag_top_k = 4
+rag_ready_timeout = 10  # seconds a QA request waits for the index while it is still loading
+rag_reload_prewarm = 50  # recent searches replayed on a new index version before it is swapped in
+rag_search_history_size = 100  # recent searches kept for /rag-stats (ring buffer)
+rag_latency_buckets_ms = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+rag_hybrid = True  # fuse BM25 (lexical) with vector search
+rag_hybrid_fetch = 2  # candidates per retriever = k * fetch
+rag_rrf_k = 60
+qa_condense_question = True  # False - never spend an LLM call rewriting follow-ups
+qa_fast_path = True  # answer table lookups without the LLM
+fast_path_min_match = 0.6  # share of a service label's tokens found in the question
+
 # ----- chatbot --------------------------------------------------------------
 
 chatbot_system_collection = """
@@ -43,12 +102,75 @@ When ALL user information is filled mark <collection_complete> = True, then expr
 
 """
 
+# ----- collection slot filling (no LLM for unambiguous answers) -------------
+
+collection_slots = ["first_name", "last_name", "id_number", "gender", "age", "hmo_name", "card_number", "tier"]
+
+# which field an assistant question asks about - checked in this order (most specific first)
+collection_slot_keywords = {
+    "card_number": ["מספר כרטיס", "כרטיס קופה", "כרטיס הקופה", "card number"],
+    "last_name": ["שם משפחה", "שם המשפחה", "last name", "surname"],
+    "first_name": ["שם פרטי", "שמך הפרטי", "השם הפרטי", "first name"],
+    "id_number": ["מספר זהות", "תעודת זהות", "תעודת הזהות", "ת.ז", "id number"],
+    "tier": ["רמת ביטוח", "רמת הביטוח", "מסלול", "tier"],
+    "hmo_name": ["קופת חולים", "קופת החולים", "hmo"],
+    "age": ["גיל", "גילך", "בן כמה", "בת כמה", "age", "how old"],
+    "gender": ["מין", "מינך", "מגדר", "gender"],
+}
+
+collection_genders = {
+    "זכר": "זכר", "גבר": "זכר", "male": "זכר", "man": "זכר",
+    "נקבה": "נקבה", "אישה": "נקבה", "אשה": "נקבה", "female": "נקבה", "woman": "נקבה",
+}
+
+collection_greetings = ["שלום", "היי", "הי", "הלו", "בוקר טוב", "ערב טוב", "תודה", "hi", "hello", "hey", "thanks"]
+collection_non_names = ["כן", "לא", "אוקיי", "בסדר", "yes", "no", "ok", "okay"]
+
+collection_questions = {
+    "he": {
+        "first_name": "מה שמך הפרטי?",
+        "last_name": "תודה! מה שם המשפחה שלך?",
+        "id_number": "מה מספר תעודת הזהות שלך? (9 ספרות)",
+        "gender": "מה המין שלך? (זכר/נקבה)",
+        "age": "מה הגיל שלך?",
+        "hmo_name": "באיזו קופת חולים אתה חבר? (מכבי/מאוחדת/כללית)",
+        "card_number": "מה מספר כרטיס קופת החולים שלך? (9 ספרות)",
+        "tier": "מה רמת הביטוח שלך? (זהב/כסף/ארד)",
+    },
+    "en": {
+        "first_name": "What is your first name?",
+        "last_name": "Thanks! What is your last name?",
+        "id_number": "What is your ID number? (9 digits)",
+        "gender": "What is your gender? (male/female)",
+        "age": "How old are you?",
+        "hmo_name": "Which HMO are you a member of? (Maccabi/Meuhedet/Clalit)",
+        "card_number": "What is your HMO card number? (9 digits)",
+        "tier": "What is your insurance tier? (gold/silver/bronze)",
+    },
+}
+
+collection_labels = {
+    "he": {
+        "first_name": "שם פרטי", "last_name": "שם משפחה", "id_number": "מספר זהות", "gender": "מין",
+        "age": "גיל", "hmo_name": "קופת חולים", "card_number": "מספר כרטיס קופה", "tier": "רמת ביטוח",
+    },
+    "en": {
+        "first_name": "First name", "last_name": "Last name", "id_number": "ID number", "gender": "Gender",
+        "age": "Age", "hmo_name": "HMO", "card_number": "HMO card number", "tier": "Insurance tier",
+    },
+}
+
+collection_summary = {
+    "he": ("אלו הפרטים שאספתי:", "האם הפרטים נכונים?"),
+    "en": ("Here are the details I collected:", "Are these details correct?"),
+}
+
 chatbot_system_verification = """
 #Role:
 You are a helpful assistant verifying user information for Israeli health insurance services.
 
 #Context:
-The user information collected is: {current_info}
+The collected user information is given after these instructions, under <User information>.
 Present the information clearly (each field seperated by \n\n) and ask for confirmation or changes.
 
 #Format:
@@ -58,24 +180,29 @@ If the user DID NOT approve - ask which specific field they want to modify, upda
 If the user DID approve - you MUST mark <verified> = True, then thank him in <assistant_message>: "מעולה! עכשיו אני יכול לעזור לך עם שאלות על שירותי הבריאות שלך."
 """
 
+# per-user part - sent after the static prompt above
+chatbot_verification_info = "<User information> {current_info}"
+
 chatbot_system_qa = """
 #Role:
 You are a knowledgeable assistant specializing in Israeli health insurance services.
 
-#Context:
-<User information> {user_info}
-<Context> {context}
-<Question> {question}
-
 #Instructions:
-Provide specific information relevant to the user's HMO ({hmo_name}) and insurance tier ({tier}).
-Use the following pieces of <Context> and <User information> to answer the <Question>,
+Provide specific information relevant to the user's <HMO> and insurance <Tier>.
+Use the pieces of <Context> and <User information> below to answer the <Question>,
 If you don't know the answer based on <Context> and <User information>, just say that you don't know.
 
 #Format:
 (CRITICAL) you must respond with the following json format {json_format}
 Put your answer in <assistant_message>.
 If information is not available for their specific HMO or tier, clearly state this in <assistant_message>.
+
+#Context:
+<HMO> {hmo_name}
+<Tier> {tier}
+<User information> {user_info}
+<Context> {context}
+<Question> {question}
 """
 
 chatbot_format_user_info = """{
@@ -102,7 +229,24 @@ chatbot_format_qa = """{
   "tier_specific": bool
 }"""
 
+chatbot_warming_message = "מאגר המידע עדיין נטען, אנא נסה שוב בעוד מספר שניות."
+chatbot_timeout_message = "מצטער, הבקשה לקחה יותר מדי זמן. אנא נסה שוב."
+
 chatbot_server_endpoint = "http://localhost:8000/chat"
+chatbot_stream_endpoint = "http://localhost:8000/chat/stream"
+
+chat_workers = 16  # concurrent LLM / retrieval calls per server worker
+chat_timeout = 60  # seconds per /chat request
+chat_disconnect_poll = 0.5  # seconds between client-disconnect checks
+
+# ----- conversation context -------------------------------------------------
+
+# per phase: last N turns sent verbatim, older turns summarized, all within the token budget
+context_keep_turns = {"collection": 4, "verification": 2}
+context_token_budget = {"collection": 1200, "verification": 600}
+context_summary_tokens = 200
+context_encoding = "o200k_base"  # gpt-4o family
+context_chars_per_token = 3  # estimate when the encoder is unavailable
 
 # ----- validations --------------------------------------------------------------
 
@@ -110,7 +254,32 @@ validation_hmo = ["מכבי", "מאוחדת", "כללית", "maccabi", "meuhedet
 validation_tiers = ["זהב", "כסף", "ארד", "gold", "silver", "bronze"]
 validation_min_age = 0
 validation_max_age = 120
+
+hmo_aliases = {
+    "מכבי": "מכבי", "maccabi": "מכבי",
+    "מאוחדת": "מאוחדת", "meuhedet": "מאוחדת",
+    "כללית": "כללית", "clalit": "כללית",
+}
+tier_aliases = {
+    "זהב": "זהב", "gold": "זהב",
+    "כסף": "כסף", "silver": "כסף",
+    "ארד": "ארד", "bronze": "ארד",
+}
+
+# aliases that are also plain words ("כסף" money, "כללית" general) name an HMO / tier in free text
+# only next to one of the context words ("קופת חולים כללית", "מסלול כסף")
+ambiguous_aliases = ["כסף", "כללית"]
+alias_context_words = ["מסלול", "רמת", "קופת", "חולים", "ביטוח", "tier", "plan", "hmo"]
+
+# ----- sessions --------------------------------------------------------------
+
+# memory: per-process LRU / sqlite: shared by every worker on the host
+session_backend = os.getenv("SESSION_BACKEND", "memory")
 session_timeout = 1800
+session_capacity = 1000
+session_max_bytes = 32 * 1024 * 1024
+session_db_path = str(Path(__file__).parent.parent / "Cache" / "sessions.sqlite3")
+conversation_max_messages = 40  # server-side transcript kept per session id
 
 
 
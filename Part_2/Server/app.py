@@ -3,10 +3,13 @@ import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent.parent))  # Common/ (shared with Part_1)
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from Core.logger_setup import get_logger
 from routes import router
+import rag
 
 # ------------- logger ----------------------------------------------
 
@@ -14,7 +17,14 @@ logger = get_logger(__name__)
 
 # ------------- app -------------------------------------------------
 
-app = FastAPI(title="HMO Chatbot", version="0.1-alpha")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+
+    # index loads in a background thread - collection / verification are served meanwhile
+    rag.start()
+    yield
+
+app = FastAPI(title="HMO Chatbot", version="0.1-alpha", lifespan=lifespan)
 
 # ------------- include routes --------------------------------------
 
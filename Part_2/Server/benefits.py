@@ -0,0 +1,284 @@
+from langchain.schema import Document
+from bs4 import BeautifulSoup, Tag
+from typing import Dict, List
+import re
+
+from Core import config
+from Core.logger_setup import get_logger
+from lexical import tokenize, canonical, mentions
+
+
+# ------------- logger ----------------------------------------------
+
+logger = get_logger(__name__)
+
+
+# ------------- table parsing ---------------------------------------
+
+def extract_tables(soup: BeautifulSoup, source: str) -> List[Dict]:
+
+    # parsed benefits tables are removed from the soup - the rest is chunked as text
+
+    category = source.rsplit(".", 1)[0]
+    heading = soup.find(['h1', 'h2'])
+    category_title = heading.get_text(strip=True) if heading else category
+
+    records = []
+
+    for table in soup.find_all("table"):
+
+        rows = table.find_all("tr")
+        if not rows:
+            continue
+
+        # ------ header: service label + one column per HMO ------
+
+        headers = [cell.get_text(strip=True) for cell in rows[0].find_all(["th", "td"])]
+        hmos = [config.hmo_aliases.get(header.lower()) for header in headers[1:]]
+
+        if not any(hmos):
+            continue  # not a benefits table
+
+        table_records = []
+
+        # ------ rows: (service, HMO) cell -> tier benefits ------
+
+        for row in rows[1:]:
+
+            cells = row.find_all(["td", "th"])
+            if len(cells) < 2:
+                continue
+
+            service = cells[0].get_text(strip=True)
+
+            for hmo, cell in zip(hmos, cells[1:]):
+                if hmo is None:
+                    continue
+
+                for tier, benefit in parse_cell(cell).items():
+                    table_records.append({
+                        "category": category,
+                        "category_title": category_title,
+                        "service": service,
+                        "hmo": hmo,
+                        "tier": tier,
+                        "benefit": benefit,
+                        "source": source,
+                    })
+
+        if table_records:
+            records.extend(table_records)
+            table.decompose()
+
+    return records
+
+def parse_cell(cell: Tag) -> Dict[str, str]:
+
+    # <strong>זהב:</strong> benefit text<br><strong>כסף:</strong> ...
+    benefits = {}
+
+    for label in cell.find_all("strong"):
+
+        tier = config.tier_aliases.get(label.get_text(strip=True).rstrip(":").strip().lower())
+        if tier is None:
+            continue
+
+        parts = []
+        for sibling in label.next_siblings:
+            if isinstance(sibling, Tag) and sibling.name == "strong":
+                break
+            text = sibling.get_text(" ", strip=True) if isinstance(sibling, Tag) else str(sibling)
+            if text.strip():
+                parts.append(text.strip())
+
+        benefits[tier] = re.sub(r'\s+', ' ', " ".join(parts)).strip()
+
+    return benefits
+
+# ------------- row-aligned chunks ----------------------------------
+
+def benefit_documents(records: List[Dict]) -> List[Document]:
+
+    # one compact chunk per (service, HMO) - tiers of a row never get split apart
+    rows = {}
+
+    for record in records:
+        key = (record["category"], record["service"], record["hmo"])
+        rows.setdefault(key, []).append(record)
+
+    docs = []
+
+    for (category, service, hmo), row in rows.items():
+
+        benefits = {record["tier"]: record["benefit"] for record in row}
+        tiers_text = " | ".join(f"{tier}: {benefit}" for tier, benefit in benefits.items())
+
+        docs.append(Document(
+            page_content=f"[קטגוריה: {row[0]['category_title']}] [שירות: {service}] [קופת חולים: {hmo}] {tiers_text}",
+            metadata={
+                "category": category,
+                "category_title": row[0]["category_title"],
+                "service": service,
+                "hmos": [hmo],
+                "tiers": list(benefits),
+                "benefits": benefits,
+                "file": row[0]["source"],
+            }
+        ))
+
+    return docs
+
+# ------------- fast path cues --------------------------------------
+
+FAST_PATH_LOOKUP_CUES = {
+    "כמה", "מחיר", "עולה", "עלות", "הנחה", "הנחות", "מגיע", "זכאי", "זכאית", "כיסוי", "מכוסה",
+    "הטבה", "הטבות", "חינם", "מקבל", "מקבלת", "much", "price", "cost", "costs", "discount",
+    "covered", "coverage", "benefit", "benefits", "free",
+}
+FAST_PATH_OPEN_CUES = {
+    "למה", "מדוע", "איך", "השווה", "להשוות", "הבדל", "ההבדל", "הסבר", "תסביר", "ממליץ", "כדאי",
+    "why", "compare", "difference", "explain", "recommend", "should",
+}
+LOOKUP_CUE_STEMS = set(tokenize(" ".join(FAST_PATH_LOOKUP_CUES)))
+OPEN_CUE_STEMS = set(tokenize(" ".join(FAST_PATH_OPEN_CUES)))
+
+# ------------- keyed benefits index --------------------------------
+
+class BenefitsIndex:
+
+    def __init__(self):
+
+        self.records = {}         # (category, service, hmo, tier) -> record
+        self.services = {}        # service label -> categories
+        self.service_tokens = {}  # service label -> stemmed label tokens
+
+    def add(self, record: Dict):
+
+        key = (record["category"], record["service"], record["hmo"], record["tier"])
+        self.records[key] = record
+        self.services.setdefault(record["service"], set()).add(record["category"])
+        self.service_tokens[record["service"]] = set(tokenize(record["service"]))
+
+    @classmethod
+    def from_documents(cls, docs: List[Document]) -> "BenefitsIndex":
+
+        # rebuilt from the row chunks in the docstore - no HTML re-parse on load
+        index = cls()
+
+        for doc in docs:
+            metadata = doc.metadata
+            if "benefits" not in metadata:
+                continue
+
+            for tier, benefit in metadata["benefits"].items():
+                index.add({
+                    "category": metadata["category"],
+                    "category_title": metadata.get("category_title", metadata["category"]),
+                    "service": metadata["service"],
+                    "hmo": metadata["hmos"][0],
+                    "tier": tier,
+                    "benefit": benefit,
+                    "source": metadata.get("file", ""),
+                })
+
+        logger.info(f"Benefits index: {len(index)} records, {len(index.services)} services")
+        return index
+
+    def lookup(self, service: str, hmo: str | None = None, tier: str | None = None,
+               category: str | None = None) -> List[Dict]:
+
+        hmo = canonical("hmo", hmo)
+        tier = canonical("tier", tier)
+
+        # direct keyed lookups - no scan over the records
+        categories = [category] if category else sorted(self.services.get(service, ()))
+        hmos = [hmo] if hmo else list(dict.fromkeys(config.hmo_aliases.values()))
+        tiers = [tier] if tier else list(dict.fromkeys(config.tier_aliases.values()))
+
+        records = []
+
+        for record_category in categories:
+            for record_hmo in hmos:
+                for record_tier in tiers:
+                    record = self.records.get((record_category, service, record_hmo, record_tier))
+                    if record:
+                        records.append(record)
+
+        return records
+
+    def match_service(self, question: str) -> str | None:
+
+        question_tokens = set(tokenize(question))
+        scores = {}
+
+        for service, tokens in self.service_tokens.items():
+            if tokens:
+                scores[service] = len(tokens & question_tokens) / len(tokens)
+
+        if not scores:
+            return None
+
+        best = max(scores.values())
+        matches = [service for service, score in scores.items() if score == best]
+
+        # one clear row label, or nothing (ambiguous questions go to the LLM)
+        if best < config.fast_path_min_match or len(matches) != 1:
+            return None
+
+        return matches[0]
+
+    def answer(self, question: str, hmo: str | None, tier: str | None, language: str = "he") -> Dict | None:
+
+        # ------ lookup-style questions only ---------------------
+
+        words = set(tokenize(question))
+
+        if words & OPEN_CUE_STEMS:
+            return None
+        if not words & LOOKUP_CUE_STEMS and len(words) > 3:
+            return None
+
+        service = self.match_service(question)
+        if service is None:
+            return None
+
+        # ------ the user's own HMO / tier, plus one named in the question ----
+
+        named_hmos, unsure_hmos = mentions("hmo", question)
+        named_tiers, unsure_tiers = mentions("tier", question)
+
+        # "כסף" / "כללית" without a context word may or may not name a tier / HMO - leave it to the LLM
+        if unsure_hmos or unsure_tiers:
+            return None
+
+        hmos = [name for name in dict.fromkeys([canonical("hmo", hmo), *named_hmos]) if name]
+        tiers = [name for name in dict.fromkeys([canonical("tier", tier), *named_tiers]) if name]
+
+        # more than one other HMO / tier is a comparison - leave it to the LLM
+        if not hmos or not tiers or len(hmos) > 2 or len(tiers) > 2:
+            return None
+
+        records = [
+            record
+            for record_hmo in hmos
+            for record_tier in tiers
+            for record in self.lookup(service, record_hmo, record_tier)
+        ]
+
+        if not records:
+            return None
+
+        # ------ templated answer ---------------------------------
+
+        if language == "he":
+            lines = [f"{service} ({records[0]['category_title']}):"]
+            lines += [f"- {r['hmo']}, מסלול {r['tier']}: {r['benefit']}" for r in records]
+        else:
+            lines = [f"{service} ({records[0]['category_title']}):"]
+            lines += [f"- {r['hmo']}, {r['tier']} tier: {r['benefit']}" for r in records]
+
+        return {"answer": "\n".join(lines), "records": records}
+
+    def __len__(self) -> int:
+
+        return len(self.records)
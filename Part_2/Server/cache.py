@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import numpy as np
+import threading
+import pickle
+import copy
+import time
+
+
+class LRUCache:
+
+    def __init__(self, max_entries: int, ttl: float, max_bytes: int):
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()   # key -> (value, size, expires_at)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ------------- main cache functionalities -------------------------------------------
+
+    def get(self, key: str) -> Any | None:
+
+        with self.lock:
+
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # ------ expired ------------------------
+
+            if entry[2] < time.time():
+                self.remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            # ------ hit - most recently used -------
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            # callers may mutate what they get back
+            return copy.deepcopy(entry[0])
+
+    def put(self, key: str, value: Any):
+
+        value = copy.deepcopy(value)
+        size = len(pickle.dumps(value))
+
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+
+            if key in self.entries:
+                self.remove(key)
+
+            self.entries[key] = (value, size, time.time() + self.ttl)
+            self.total_bytes += size
+
+            # ------ evict least recently used ------
+
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str):
+
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+
+    def expire(self) -> int:
+
+        # drop every expired entry now, instead of on its next get
+        now = time.time()
+
+        with self.lock:
+            expired = [key for key, (_, _, expires_at) in self.entries.items() if expires_at < now]
+            for key in expired:
+                self.remove(key)
+            self.expirations += len(expired)
+
+        return len(expired)
+
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict:
+
+        total_requests = self.hits + self.misses
+
+        return {
+            "size": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total_requests if total_requests > 0 else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    # ------------- helpers -------------------------------------------
+
+    def remove(self, key: str):
+
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def __len__(self) -> int:
+
+        return len(self.entries)
+
+
+class SemanticCache:
+
+    def __init__(self, threshold: float, max_entries: int, ttl: float):
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # scope -> unit vectors matrix + parallel values / expiry lists
+        self.scopes = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    # ------------- main cache functionalities -------------------------------------------
+
+    def get(self, vector: List[float], scope: Tuple = ()) -> Tuple[Any, float] | None:
+
+        query = self.normalize(vector)
+
+        with self.lock:
+
+            entries = self.scopes.get(scope)
+
+            if entries is None or not entries["values"]:
+                self.misses += 1
+                return None
+
+            # ------ nearest previous question (cosine) -----
+
+            similarities = entries["vectors"] @ query
+            similarities[np.asarray(entries["expires"]) < time.time()] = -1.0
+            best = int(np.argmax(similarities))
+
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            value = copy.deepcopy(entries["values"][best])
+
+        return value, float(similarities[best])
+
+    def put(self, vector: List[float], scope: Tuple, value: Any):
+
+        row = self.normalize(vector)[np.newaxis, :]
+        value = copy.deepcopy(value)
+
+        with self.lock:
+
+            entries = self.scopes.get(scope)
+
+            if entries is None:
+                self.scopes[scope] = {"vectors": row, "values": [value], "expires": [time.time() + self.ttl]}
+                return
+
+            entries["vectors"] = np.vstack([entries["vectors"], row])
+            entries["values"].append(value)
+            entries["expires"].append(time.time() + self.ttl)
+
+            # ------ drop oldest questions ---------------
+
+            overflow = len(entries["values"]) - self.max_entries
+            if overflow > 0:
+                entries["vectors"] = entries["vectors"][overflow:]
+                del entries["values"][:overflow]
+                del entries["expires"][:overflow]
+
+    def clear(self):
+
+        with self.lock:
+            self.scopes.clear()
+
+    def stats(self) -> Dict:
+
+        total_requests = self.hits + self.misses
+
+        return {
+            "scopes": len(self.scopes),
+            "size": sum(len(entries["values"]) for entries in self.scopes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total_requests if total_requests > 0 else 0,
+        }
+
+    # ------------- helpers -------------------------------------------
+
+    def normalize(self, vector: List[float]) -> np.ndarray:
+
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -0,0 +1,138 @@
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import threading
+import re
+
+from Core import config
+from Core.logger_setup import get_logger
+
+
+# ------------- logger ----------------------------------------------
+
+logger = get_logger(__name__)
+
+CITATIONS = re.compile(r"\n*\*\*(מקורות:|לא נמצאו מקורות תומכים)\*\*.*", re.DOTALL)
+QUESTION = re.compile(r"[^.!?\n]*\?")
+
+# ------------- token counting --------------------------------------
+
+@lru_cache(maxsize=1)
+def encoder():
+
+    # tiktoken fetches its BPE file on first use - offline it falls back to an estimate
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(config.context_encoding)
+    except Exception as e:
+        logger.warning(f"Token encoder unavailable, estimating by length: {str(e)}")
+        return None
+
+def count_tokens(text: str) -> int:
+
+    enc = encoder()
+    if enc is None:
+        return len(text) // config.context_chars_per_token + 1
+    return len(enc.encode(text))
+
+def message_tokens(messages: List[Dict[str, str]]) -> int:
+
+    # + per-message framing overhead of the chat format
+    return sum(count_tokens(m.get("content", "")) + 4 for m in messages)
+
+# ------------- history window --------------------------------------
+
+def strip_citations(text: str) -> str:
+
+    return CITATIONS.sub("", text).rstrip()
+
+def last_question(text: str) -> str | None:
+
+    questions = QUESTION.findall(text)
+    return questions[-1].strip() if questions else None
+
+def turns(messages: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+
+    # a turn opens with the assistant's question and holds the user's answer to it -
+    # windows and summaries never separate an answer from its question
+    grouped = []
+    for message in messages:
+        if message["role"] == "assistant" or not grouped:
+            grouped.append([])
+        grouped[-1].append(message)
+
+    return grouped
+
+def summarize(older: List[List[Dict[str, str]]], budget: int) -> str | None:
+
+    # extractive, no extra LLM call - each answer with the question it answered, most recent kept
+    said = []
+    for turn in older:
+        asked = next((last_question(m["content"]) for m in reversed(turn) if m["role"] == "assistant"), None)
+        for m in turn:
+            if m["role"] == "user" and m["content"]:
+                said.append(f"{asked} {m['content']}" if asked else m["content"])
+
+    if not said:
+        return None
+
+    kept = []
+    for text in reversed(said):
+        if count_tokens(" | ".join([text, *kept])) > budget:
+            break
+        kept.insert(0, text)
+
+    return "Earlier in this conversation the user answered: " + " | ".join(kept) if kept else None
+
+def bound_history(history: List[Dict[str, str]], phase: str, summary: bool = True) -> Tuple[List[Dict[str, str]], Dict]:
+
+    # last N turns verbatim, older turns summarized (or dropped), all within the phase budget
+    keep_turns = config.context_keep_turns[phase]
+    budget = config.context_token_budget[phase]
+
+    cleaned = [
+        {"role": m.get("role", "user"), "content": strip_citations(m.get("content", ""))}
+        for m in history if m.get("content")
+    ]
+
+    # + 1 - the trailing turn is the last question, answered by the current message
+    grouped = turns(cleaned)
+    recent = grouped[-(keep_turns + 1):] if keep_turns else []
+    older = grouped[:len(grouped) - len(recent)]
+
+    while len(recent) > 1 and message_tokens([m for turn in recent for m in turn]) > budget:
+        older.append(recent.pop(0))
+
+    window = [m for turn in recent for m in turn]
+    messages = list(window)
+    if summary and older:
+        text = summarize(older, min(config.context_summary_tokens, max(budget - message_tokens(window), 0)))
+        if text:
+            messages.insert(0, {"role": "system", "content": text})
+
+    original = message_tokens(history)
+    sent = message_tokens(messages)
+
+    report = {
+        "phase": phase,
+        "original_tokens": original,
+        "sent_tokens": sent,
+        "saved_tokens": max(original - sent, 0),
+        "dropped_messages": len(history) - len(window),
+    }
+
+    record(report)
+    return messages, report
+
+# ------------- savings ---------------------------------------------
+
+context_stats = {}
+stats_lock = threading.Lock()
+
+def record(report: Dict):
+
+    with stats_lock:
+        phase = context_stats.setdefault(report["phase"], {"requests": 0, "original_tokens": 0, "sent_tokens": 0, "saved_tokens": 0})
+        phase["requests"] += 1
+        phase["original_tokens"] += report["original_tokens"]
+        phase["sent_tokens"] += report["sent_tokens"]
+        phase["saved_tokens"] += report["saved_tokens"]
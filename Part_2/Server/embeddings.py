@@ -0,0 +1,291 @@
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain.storage.encoder_backed import EncoderBackedStore
+from langchain_core.embeddings import Embeddings
+from langchain_openai import AzureOpenAIEmbeddings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Tuple
+import numpy as np
+import unicodedata
+import threading
+import hashlib
+import random
+import time
+import zlib
+import re
+
+from Core import config
+from Core.logger_setup import get_logger
+from lexical import tokenize, TOKENIZER_VERSION
+
+
+# ------------- logger ----------------------------------------------
+
+logger = get_logger(__name__)
+
+# ------------- cache keys ------------------------------------------
+
+def normalize_text(text: str) -> str:
+
+    # NFC + collapsed whitespace - trivially different copies share one vector
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def cache_key(model: str, text: str) -> str:
+
+    model = re.sub(r'[^a-zA-Z0-9_.\-]', '_', model)
+    text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+    # sharded as <model>/<ab>/<hash> to keep directories small
+    return f"{model}/{text_hash[:2]}/{text_hash}"
+
+# ------------- (de)serialization -----------------------------------
+
+def serialize_vector(vector: List[float]) -> bytes:
+
+    # float32 is what FAISS stores anyway
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def deserialize_vector(data: bytes) -> List[float]:
+
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+# ------------- local backend ---------------------------------------
+
+@lru_cache(maxsize=200_000)
+def hash_feature(feature: str, dim: int) -> Tuple[int, float]:
+
+    # crc32 - stable across processes, unlike hash()
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dim, 1.0 if h & 0x80000000 else -1.0
+
+class HashingEmbeddings(Embeddings):
+
+    # signed feature hashing of stemmed words + character n-grams, no model download
+    def __init__(self, dim: int, ngrams: Tuple[int, ...], batch_size: int):
+
+        self.dim = dim
+        self.ngrams = ngrams
+        self.batch_size = batch_size
+
+    def features(self, text: str) -> List[str]:
+
+        features = []
+
+        for token in tokenize(normalize_text(text)):
+            features.append(f"w:{token}")
+            padded = f"<{token}>"
+            for n in self.ngrams:
+                features.extend(f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+
+        return features
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+
+        rows, cols, signs = [], [], []
+
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                col, sign = hash_feature(feature, self.dim)
+                rows.append(row)
+                cols.append(col)
+                signs.append(sign)
+
+        # ------ scatter-add, sublinear tf, unit rows ------
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), np.asarray(signs, dtype=np.float32))
+
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1.0)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+
+        vectors = [self.embed_batch(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        return np.vstack(vectors).tolist() if vectors else []
+
+    def embed_query(self, text: str) -> List[float]:
+
+        return self.embed_batch([text])[0].tolist()
+
+# ------------- backend selection -----------------------------------
+
+def embedding_model() -> str:
+
+    # part of the index manifest and of the cache keys - switching backends never mixes vectors
+    if config.rag_embedding_backend == "local":
+        return f"local-hashing-v{TOKENIZER_VERSION}-{config.rag_local_embedding_dim}-{'-'.join(map(str, config.rag_local_embedding_ngrams))}"
+
+    return config.openai_emb
+
+def create_embeddings() -> Embeddings:
+
+    backend = config.rag_embedding_backend
+
+    if backend == "local":
+        embeddings = HashingEmbeddings(
+            dim=config.rag_local_embedding_dim,
+            ngrams=tuple(config.rag_local_embedding_ngrams),
+            batch_size=config.rag_local_embedding_batch,
+        )
+    elif backend == "azure":
+        embeddings = AzureOpenAIEmbeddings(
+            azure_endpoint=config.openai_endpoint,
+            api_key=config.openai_key,
+            deployment=config.openai_emb,
+            api_version=config.openai_version,
+        )
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    logger.info(f"Embedding backend: {backend} ({embedding_model()})")
+    return cached_embeddings(embeddings, model=embedding_model())
+
+# ------------- cached embeddings -----------------------------------
+
+def cached_embeddings(embeddings: Embeddings, model: str) -> Embeddings:
+
+    if not config.rag_embedding_cache:
+        return embeddings
+
+    store = EncoderBackedStore(
+        LocalFileStore(config.rag_embedding_cache_dir),
+        lambda text: cache_key(model, text),
+        serialize_vector,
+        deserialize_vector,
+    )
+
+    logger.info(f"Embedding cache enabled at {config.rag_embedding_cache_dir} ({model})")
+
+    # one store for both - a query equal to a chunk reuses its vector
+    return CacheBackedEmbeddings(
+        embeddings,
+        store,
+        batch_size=config.rag_embedding_cache_batch,
+        query_embedding_store=store,
+    )
+
+# ------------- batched concurrent embedding ------------------------
+
+def is_rate_limited(error: Exception) -> bool:
+
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+def retry_after(error: Exception) -> float | None:
+
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class BatchEmbedder:
+
+    def __init__(self, embeddings: Embeddings, batch_size: int, workers: int, max_retries: int, backoff: float):
+
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        # shared by all workers - one 429 pauses every request, not just the one that hit it
+        self.cooldown_until = 0.0
+        self.lock = threading.Lock()
+
+        self.start = 0.0
+        self.submitted = 0
+        self.done = 0
+        self.stats = {"chunks": 0, "batches": 0, "retries": 0, "rate_limited": 0, "seconds": 0.0, "chunks_per_second": 0.0}
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+
+        for attempt in range(self.max_retries + 1):
+
+            wait = self.cooldown_until - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                return self.embeddings.embed_documents(texts)
+
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+
+                # ------ adaptive backoff: Retry-After, else exponential + jitter ----
+
+                delay = retry_after(e) or self.backoff * (2 ** attempt) * (1 + random.random())
+
+                with self.lock:
+                    self.cooldown_until = max(self.cooldown_until, time.time() + delay)
+                    self.stats["retries"] += 1
+                    self.stats["rate_limited"] += 1
+
+                logger.warning(f"Embedding rate limited, retrying batch in {delay:.1f}s (attempt {attempt + 1})")
+
+    def run(self, texts: Iterable[str]) -> Iterator[Tuple[int, List[List[float]]]]:
+
+        # texts may be a stream - batches are submitted as they fill up, and
+        # (offset, vectors) is yielded as soon as each one completes
+        self.start = time.time()
+        self.submitted = 0
+        self.done = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed-batch") as pool:
+
+            pending = {}
+            batch = []
+
+            for text in texts:
+
+                batch.append(text)
+                if len(batch) < self.batch_size:
+                    continue
+
+                pending[pool.submit(self.embed_batch, batch)] = self.submitted
+                self.submitted += len(batch)
+                batch = []
+
+                # hand back finished batches while the producer keeps going
+                for future in [future for future in pending if future.done()]:
+                    yield self.complete(future, pending.pop(future))
+
+            if batch:
+                pending[pool.submit(self.embed_batch, batch)] = self.submitted
+                self.submitted += len(batch)
+
+            for future in as_completed(pending):
+                yield self.complete(future, pending[future])
+
+    def complete(self, future, offset: int) -> Tuple[int, List[List[float]]]:
+
+        vectors = future.result()
+        self.done += len(vectors)
+
+        # ------ progress ------------------------------
+        elapsed = time.time() - self.start
+        self.stats.update(
+            chunks=self.done,
+            batches=self.stats["batches"] + 1,
+            seconds=round(elapsed, 3),
+            chunks_per_second=round(self.done / elapsed, 1) if elapsed > 0 else 0.0,
+        )
+        logger.info(f"Embedded {self.done}/{self.submitted} chunks ({self.stats['chunks_per_second']} chunks/s, "
+                    f"{self.stats['retries']} retries)")
+
+        return offset, vectors
+
+def batch_embedder(embeddings: Embeddings) -> BatchEmbedder:
+
+    return BatchEmbedder(
+        embeddings,
+        batch_size=config.rag_embedding_batch_size,
+        workers=config.rag_embedding_workers,
+        max_retries=config.rag_embedding_max_retries,
+        backoff=config.rag_embedding_backoff,
+    )
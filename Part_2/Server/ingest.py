@@ -0,0 +1,222 @@
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from bs4 import BeautifulSoup, Tag
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import multiprocessing
+import hashlib
+import time
+import re
+
+from Core import config
+from Core.logger_setup import get_logger
+from benefits import extract_tables, benefit_documents
+from lexical import mentioned
+
+
+# ------------- logger ----------------------------------------------
+
+logger = get_logger(__name__)
+
+HEADERS = ['h1', 'h2', 'h3', 'h4']
+
+# ------------- parsing ---------------------------------------------
+
+def parse_html(file: Path) -> Tuple[List[str], List[Dict]] | None:
+
+    try:
+        hmo = file.stem
+
+        with open(file, 'r', encoding='utf-8') as f:
+            soup = BeautifulSoup(f.read(), "lxml")
+
+        sections = []
+
+        # ------- Remove : script / style --------------------------------------
+
+        for script in soup(["script", "style"]):
+            script.decompose()
+
+        # ------- Extract : benefits tables --------------------------------
+
+        records = extract_tables(soup, file.name)
+
+        # ------- Divide : headers --------------------------------------
+
+        for section_title, content in header_sections(soup):
+            section_text = f"[כותרת: {section_title}] {' '.join(content)}"
+            sections.append(f"[קופת חולים: {hmo}] {section_text}")
+
+        # ------- Divide : paragraph (if no headers) ---------------------
+
+        if not sections:
+            for p in soup.find_all('p'):
+                text = p.get_text(strip=True)
+                if text and len(text) > 20:  # Skip very short paragraphs
+                    sections.append(f"[קופת חולים: {hmo}] {text}")
+
+        # ------- Get all Text (no paragraphs) ----------------------------
+
+        if not sections:
+            text = soup.get_text(separator=' ', strip=True)
+            text = re.sub(r'\s+', ' ', text)
+            if text:
+                sections.append(f"[קופת חולים: {hmo}] {text}")
+
+        return sections, records
+
+    except Exception as e:
+        logger.error(f"Error processing {file}: {str(e)}")
+        return None
+
+def header_sections(soup: BeautifulSoup) -> List[Tuple[str, List[str]]]:
+
+    # one pass over the children of each header's parent - every sibling is visited once,
+    # instead of find_next_siblings() rescanning to the end of the document per header
+    headers = soup.find_all(HEADERS)
+    content = {id(header): [] for header in headers}
+
+    # keyed by id() - a Tag's hash is its serialized markup
+    parents = {id(header.parent): header.parent for header in headers}
+
+    for parent in parents.values():
+
+        current = None
+
+        for child in parent.children:
+            if not isinstance(child, Tag):
+                continue
+            if child.name in HEADERS:
+                current = child
+                continue
+            if current is not None:
+                text = child.get_text(strip=True)
+                if text:
+                    content[id(current)].append(text)
+
+    # document order, headers without content dropped
+    return [(header.get_text(strip=True), content[id(header)]) for header in headers if content[id(header)]]
+
+# ------------- chunking --------------------------------------------
+
+@lru_cache(maxsize=4)
+def splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
+        length_function=len,
+    )
+
+def chunk_file(file: Path, chunk_size: int, chunk_overlap: int) -> Tuple[List[Document] | None, Dict]:
+
+    # runs in a worker process - settings are passed in, not read from (the parent's) config
+    start = time.perf_counter()
+    parsed = parse_html(file)
+    parse_ms = (time.perf_counter() - start) * 1000
+
+    if parsed is None:
+        return None, {"parse_ms": round(parse_ms, 2)}
+
+    sections, records = parsed
+    text_splitter = splitter(chunk_size, chunk_overlap)
+    docs = []
+    seen = {}
+
+    def chunk_id(chunk: str) -> str:
+
+        # content addressed id - unchanged chunks keep their vectors
+        chunk_hash = hashlib.sha256(f"{file.name}\n{chunk}".encode()).hexdigest()[:32]
+        seen[chunk_hash] = seen.get(chunk_hash, -1) + 1
+        return chunk_hash if not seen[chunk_hash] else f"{chunk_hash}_{seen[chunk_hash]}"
+
+    for content in sections:
+
+        # ------ HMO ------------------
+
+        hmo_match = re.search(r'\[קופת חולים: ([^\]]+)\]', content)
+        hmo_name = hmo_match.group(1) if hmo_match else "unknown"
+
+        # ------ split to chunks ------------------
+
+        chunks = text_splitter.split_text(content)
+
+        # ------ create advanced docs ------------------
+
+        for i, chunk in enumerate(chunks):
+
+            doc = Document(
+                page_content=chunk,
+                metadata={
+                    "hmo": hmo_name,
+                    "category": file.stem,
+                    # whole-word aliases next to a context word - "כסף" / "כללית" as plain words tag nothing
+                    "hmos": mentioned("hmo", chunk),
+                    "tiers": mentioned("tier", chunk),
+                    "chunk_index": i,
+                    "chunk_id": chunk_id(chunk),
+                    "file": file.name,
+                    "source": f"{hmo_name}_chunk_{i}",
+                    "timestamp": datetime.now().isoformat()
+                }
+            )
+            docs.append(doc)
+
+    # ------ row-aligned benefits chunks (one per service + HMO) ------
+
+    for i, doc in enumerate(benefit_documents(records)):
+        doc.metadata.update({
+            "hmo": file.stem,
+            "chunk_index": i,
+            "chunk_id": chunk_id(doc.page_content),
+            "source": f"{file.stem}_row_{i}",
+            "timestamp": datetime.now().isoformat()
+        })
+        docs.append(doc)
+
+    timing = {
+        "parse_ms": round(parse_ms, 2),
+        "chunk_ms": round((time.perf_counter() - start) * 1000 - parse_ms, 2),
+        "sections": len(sections),
+        "records": len(records),
+        "chunks": len(docs),
+    }
+
+    return docs, timing
+
+# ------------- parallel stage --------------------------------------
+
+def chunk_files(files: List[Path], workers: int | None = None) -> Iterator[Tuple[Path, List[Document] | None, Dict]]:
+
+    # yields each file's chunks as soon as it is parsed - completion order, not file order
+    workers = config.rag_ingest_workers if workers is None else workers
+    args = (config.rag_chunk_size, config.rag_chunk_overlap)
+
+    # spawned workers re-import the main module (seconds each) - a small corpus parses faster in-process
+    small = sum(file.stat().st_size for file in files) < config.rag_ingest_parallel_min_bytes
+
+    if workers <= 1 or len(files) <= 1 or small:
+        for file in files:
+            yield (file, *chunk_file(file, *args))
+        return
+
+    # spawn, not fork - the pool is created from the warm-up thread while the server's threads run,
+    # a forked child could inherit a lock (e.g. a logging handler's) held by one of them
+    spawn = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(files)), mp_context=spawn) as pool:
+
+        futures = {pool.submit(chunk_file, file, *args): file for file in files}
+
+        for future in as_completed(futures):
+            file = futures[future]
+            try:
+                docs, timing = future.result()
+            except Exception as e:
+                logger.error(f"Error processing {file}: {str(e)}")
+                docs, timing = None, {}
+            yield file, docs, timing
@@ -0,0 +1,164 @@
+from langchain.schema import Document
+from typing import Dict, List, Tuple
+import heapq
+import math
+import re
+
+from Core import config
+
+
+# ------------- Hebrew tokenization ---------------------------------
+
+# one-letter prefixes (ו ה ב ל מ ש כ), common two-letter combinations and plural / construct suffixes
+HEBREW_PREFIXES = "והבלמשכ"
+HEBREW_PREFIX_PAIRS = ["וה", "וב", "ול", "ומ", "וש", "שה", "שב", "של", "מה", "בה", "לה", "כש"]
+HEBREW_SUFFIXES = ["יים", "ים", "ות", "י", "ה"]
+MIN_STEM = 3
+
+# bump when stem() / tokenize() change - part of the local embedding model name
+TOKENIZER_VERSION = 2
+
+def strip_suffix(token: str) -> str:
+
+    for suffix in HEBREW_SUFFIXES:
+        if token.endswith(suffix):
+            return token[:-len(suffix)]
+
+    return token
+
+def stem(token: str) -> str:
+
+    # at most one prefix (a letter or a known pair), stripped only if 3+ letters remain once the suffix
+    # is gone too - singular and plural decide alike: "כתר" / "כתרים" / "בכתרים" -> "כתר"
+    prefixes = [pair for pair in HEBREW_PREFIX_PAIRS if token.startswith(pair)]
+    if token[:1] in HEBREW_PREFIXES:
+        prefixes.append(token[0])
+
+    for prefix in prefixes:
+        stemmed = strip_suffix(token[len(prefix):])
+        if len(stemmed) >= MIN_STEM:
+            return stemmed
+
+    stemmed = strip_suffix(token)
+    return stemmed if len(stemmed) >= MIN_STEM else token
+
+WORD = re.compile(r'[א-תa-zA-Z0-9]+')
+
+def tokenize(text: str) -> List[str]:
+
+    tokens = WORD.findall(text.lower())
+    return [stem(token) for token in tokens if len(token) > 1]
+
+# ------------- HMO / tier normalization ----------------------------
+
+def canonical(field: str, value: str | None) -> str | None:
+
+    if not value:
+        return None
+
+    aliases = {"hmo": config.hmo_aliases, "tier": config.tier_aliases}.get(field)
+    if aliases is None:
+        return value
+
+    return aliases.get(str(value).strip().lower())
+
+def forms(word: str) -> set:
+
+    # the word with up to two prefix letters ("ב", "וב") and one suffix removed - candidates for an exact match
+    candidates = set()
+
+    for i in range(3):
+        if i and word[i - 1] not in HEBREW_PREFIXES:
+            break
+        base = word[i:]
+        if len(base) < 2:
+            break
+        candidates.add(base)
+        candidates.update(base[:-len(suffix)] for suffix in HEBREW_SUFFIXES if base.endswith(suffix) and len(base) - len(suffix) >= 2)
+
+    return candidates
+
+def mentions(field: str, text: str) -> Tuple[List[str], List[str]]:
+
+    # (named, unsure) - aliases count as whole words; an ambiguous one ("כסף" money, "כללית" general)
+    # only next to a context word ("מסלול כסף", "קופת חולים כללית") or as a label ("כסף:"), else it is unsure
+    aliases = {"hmo": config.hmo_aliases, "tier": config.tier_aliases}[field]
+    context = set(config.alias_context_words)
+
+    lower_text = text.lower()
+    words = [match for match in WORD.finditer(lower_text) if len(match.group()) > 1]
+    word_forms = [forms(match.group()) for match in words]
+
+    named, unsure = set(), set()
+    for i, candidates in enumerate(word_forms):
+
+        alias = next((form for form in candidates if form in aliases), None)
+        if alias is None:
+            continue
+
+        if alias not in config.ambiguous_aliases:
+            named.add(aliases[alias])
+            continue
+
+        label = lower_text[words[i].end():].lstrip().startswith(":")
+        neighbours = set().union(*word_forms[max(i - 1, 0):i], *word_forms[i + 1:i + 2])
+
+        (named if label or neighbours & context else unsure).add(aliases[alias])
+
+    return sorted(named), sorted(unsure - named)
+
+def mentioned(field: str, text: str) -> List[str]:
+
+    return mentions(field, text)[0]
+
+# ------------- BM25 inverted index ---------------------------------
+
+class BM25Index:
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+
+        self.k1 = k1
+        self.b = b
+
+        self.postings = {}   # term -> {doc id: term frequency}
+        self.lengths = {}    # doc id -> number of tokens
+        self.avg_length = 0.0
+
+    @classmethod
+    def from_documents(cls, docs: Dict[int, Document], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+
+        index = cls(k1, b)
+
+        for i, doc in docs.items():
+
+            tokens = tokenize(doc.page_content)
+            index.lengths[i] = len(tokens)
+
+            for token in tokens:
+                postings = index.postings.setdefault(token, {})
+                postings[i] = postings.get(i, 0) + 1
+
+        index.avg_length = sum(index.lengths.values()) / len(index.lengths) if index.lengths else 0.0
+        return index
+
+    def search(self, query: str, k: int, allowed: set | None = None) -> List[Tuple[int, float]]:
+
+        total = len(self.lengths)
+        scores = {}
+
+        for token in set(tokenize(query)):
+
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+
+            for i, tf in postings.items():
+                if allowed is not None and i not in allowed:
+                    continue
+
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,88 @@
+from collections import deque
+from typing import Dict, List, Tuple
+import threading
+import bisect
+
+
+class SearchStats:
+
+    def __init__(self, history_size: int, buckets_ms: Tuple[float, ...], poor_distance: float = 1.0):
+
+        # fixed-size ring of recent records + running aggregates - O(1) per search, O(buckets) per read
+        self.recent_searches = deque(maxlen=history_size)
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self.poor_distance = poor_distance
+        self.lock = threading.Lock()
+
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.poor_count = 0
+        self.degraded_count = 0
+        self.histogram = [0] * (len(self.buckets_ms) + 1)  # last bucket = overflow
+
+    # ------------- updates -------------------------------------------
+
+    def record(self, search_record: Dict):
+
+        latency = search_record.get("retrieval_time_ms", 0.0)
+
+        with self.lock:
+
+            self.recent_searches.append(search_record)
+
+            self.count += 1
+            self.total_ms += latency
+            self.max_ms = max(self.max_ms, latency)
+            self.histogram[bisect.bisect_left(self.buckets_ms, latency)] += 1
+
+            if search_record.get("avg_similarity_score", 0) > self.poor_distance:
+                self.poor_count += 1
+            if search_record.get("degraded"):
+                self.degraded_count += 1
+
+    # ------------- reads ---------------------------------------------
+
+    def recent(self, n: int = 10) -> List[Dict]:
+
+        with self.lock:
+            return list(self.recent_searches)[-n:]
+
+    def percentile(self, q: float) -> float | None:
+
+        # upper bound of the bucket holding the q-th percentile
+        if not self.count:
+            return None
+
+        target = q / 100 * self.count
+        seen = 0
+
+        for i, bucket_count in enumerate(self.histogram):
+            seen += bucket_count
+            if seen >= target:
+                return self.buckets_ms[i] if i < len(self.buckets_ms) else self.max_ms
+
+        return self.max_ms
+
+    def summary(self) -> Dict:
+
+        with self.lock:
+
+            labels = [f"<={bound:g}ms" for bound in self.buckets_ms] + [f">{self.buckets_ms[-1]:g}ms"]
+
+            return {
+                "count": self.count,
+                "avg_ms": self.total_ms / self.count if self.count else 0,
+                "max_ms": self.max_ms,
+                "p50_ms": self.percentile(50),
+                "p95_ms": self.percentile(95),
+                "p99_ms": self.percentile(99),
+                "poor_quality_count": self.poor_count,
+                "poor_quality_rate": self.poor_count / self.count if self.count else 0,
+                "degraded_count": self.degraded_count,
+                "latency_histogram": dict(zip(labels, self.histogram)),
+            }
+
+    def __len__(self) -> int:
+
+        return len(self.recent_searches)
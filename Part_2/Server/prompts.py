@@ -0,0 +1,47 @@
+from langchain.prompts import PromptTemplate
+from typing import Any, Dict, List
+import json
+
+from Core import config
+
+
+# ------------- static prefixes (rendered once, at import) ----------
+
+# byte-identical on every request of a language - provider prompt caching keys on the prefix
+LANGUAGE_INSTRUCTIONS = {
+    "he": "Answer in Hebrew only.",
+    "en": "Answer in English only.",
+}
+
+COLLECTION = {
+    language: config.chatbot_system_collection.format(info=config.chatbot_format_user_info) + f"\n\n{instruction}"
+    for language, instruction in LANGUAGE_INSTRUCTIONS.items()
+}
+
+VERIFICATION = {
+    language: config.chatbot_system_verification.format(json_format=config.chatbot_format_user_info) + f"\n\n{instruction}"
+    for language, instruction in LANGUAGE_INSTRUCTIONS.items()
+}
+
+# per-request values sit at the end of the template
+QA = PromptTemplate(
+    template=config.chatbot_system_qa,
+    input_variables=["context", "user_info", "question", "hmo_name", "tier"],
+    partial_variables={"json_format": config.chatbot_format_qa},
+)
+
+# ------------- messages --------------------------------------------
+
+def collection_messages(language: str) -> List[Dict[str, str]]:
+
+    return [{"role": "system", "content": COLLECTION.get(language, COLLECTION["he"])}]
+
+def verification_messages(language: str, current_info: Dict[str, Any]) -> List[Dict[str, str]]:
+
+    # static prompt first, the user's details after it
+    info = json.dumps(current_info, ensure_ascii=False, indent=2)
+
+    return [
+        {"role": "system", "content": VERIFICATION.get(language, VERIFICATION["he"])},
+        {"role": "system", "content": config.chatbot_verification_info.format(current_info=info)},
+    ]
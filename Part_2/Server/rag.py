@@ -1,135 +1,340 @@
 
 from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import AzureOpenAIEmbeddings
 from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from pathlib import Path
-from bs4 import BeautifulSoup
 from datetime import datetime
-from typing import Dict, List
-import re
+from typing import Dict, Iterable, Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import faiss
+import json
+import os
 import logging
 import time
 import hashlib
+import threading
 from functools import lru_cache
 
 from Core import config
 from Core.logger_setup import get_logger 
+from embeddings import batch_embedder, create_embeddings, embedding_model
+from cache import LRUCache, SemanticCache
+from metrics import SearchStats
+from benefits import BenefitsIndex
+from ingest import chunk_files
+from lexical import BM25Index, canonical
+from vector_index import build_index, configure, index_spec, search_params
 
 
 # ------------- logger ----------------------------------------------
 
 logger = get_logger(__name__)
 
+# bump when chunk text / metadata layout changes - forces a rebuild
+CHUNK_SCHEMA = 4
+
 
 class RAG:
     
     def __init__(self):
 
-        self.embeddings = AzureOpenAIEmbeddings(
-            azure_endpoint=config.openai_endpoint,
-            api_key=config.openai_key,
-            deployment=config.openai_emb,
-            api_version=config.openai_version,
-        )
+        self.embeddings = create_embeddings()
+        self.embed_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="embed")
+
+        self.indexed_files = {}
+        self.build_stats = {}
+        self.ingest_stats = {}
+        self.vstore = self.load()
+        self.content_changed = True
+
+        if self.vstore is None:
+            self.vstore = self.build()
+            self.save()
+        elif self.update():
+            self.save()
+        else:
+            self.content_changed = False
+
+        documents = self.documents()
+        self.partitions = self.partition(documents)
+        self.benefits = BenefitsIndex.from_documents(documents.values())
+        self.bm25 = BM25Index.from_documents(documents)
 
-        self.vstore = self.build()
         self.search_count = 0
-        self.search_history = []
-        self.cache = {}
-        self.cache_hits = 0
-        self.cache_misses = 0
+        self.search_history = SearchStats(
+            history_size=config.rag_search_history_size,
+            buckets_ms=config.rag_latency_buckets_ms
+        )
+        self.cache = LRUCache(
+            max_entries=config.rag_cache_max_entries,
+            ttl=config.rag_cache_ttl,
+            max_bytes=config.rag_cache_max_bytes
+        )
+        self.semantic_cache = SemanticCache(
+            threshold=config.semantic_cache_threshold,
+            max_entries=config.semantic_cache_max_entries,
+            ttl=config.semantic_cache_ttl
+        )
 
         logger.info(f"RAG initialized with {self.vstore.index.ntotal} vectors")
 
     # ------------- main RAG functionalities -------------------------------------------
 
     def build(self):
-        
-        # -------- splitter -----------------------------------------------
 
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
-            length_function=len,
-        )
-        
-        # -------- docs -----------------------------------------------
+        # -------- docs (streamed from the parsing pool into the embedder) ----
 
-        docs = []
+        self.indexed_files = {}
 
-        for content in self.parse_html():
-            
-            # ------ HMO ------------------
+        def docs() -> Iterator[Document]:
 
-            hmo_match = re.search(r'\[קופת חולים: ([^\]]+)\]', content)
-            hmo_name = hmo_match.group(1) if hmo_match else "unknown"
-            
-            # ------ split to chunks ------------------
-            
-            chunks = splitter.split_text(content)
-            
-            # ------ create advanced docs ------------------
-            
-            for i, chunk in enumerate(chunks):
-                doc = Document(
-                    page_content=chunk,
-                    metadata={
-                        "hmo": hmo_name,
-                        "chunk_index": i,
-                        "source": f"{hmo_name}_chunk_{i}",
-                        "timestamp": datetime.now().isoformat()
-                    }
-                )
-                docs.append(doc)
-        
-        
-        
-        if docs:
+            for file, file_hash, file_docs in self.chunk_files(self.corpus()):
+                if file_docs is None:
+                    continue
 
-            # total_tokens = 0
-            # for doc in docs:
-            #     # Rough estimation: ~1 token per 4 characters
-            #     estimated_tokens = len(doc.page_content) / 4
-            #     total_tokens += estimated_tokens
-            
-            # token_usage["text-embedding-ada-002"]["total_tokens"] += int(total_tokens)
-            # token_usage["text-embedding-ada-002"]["total_cost"] += (total_tokens / 1000) * token_pricing["text-embedding-ada-002"]
-            
-            # logger.info(f"Embedding {len(docs)} documents, estimated {int(total_tokens)} tokens")
-            
-            # ------ Index built --------------------------------
-            
-            vstore = FAISS.from_documents(docs, self.embeddings)
-            return vstore
-        
-        else:
+                self.indexed_files[file.name] = {
+                    "hash": file_hash,
+                    "chunks": [doc.metadata["chunk_id"] for doc in file_docs]
+                }
+                yield from file_docs
+
+        vstore = self.index_documents(docs())
+
+        if vstore is None:
             logger.error("No documents to index!")
             raise ValueError("No documents found to build vector store")
 
-    def search(self, query: str, k: int = 4) -> Dict:
+        # ------ approximate index: trained on the exact vectors ----
+
+        if config.rag_index_type != "flat":
+            vstore.index = build_index(vstore.index.reconstruct_n(0, vstore.index.ntotal))
+
+        return vstore
+
+    def update(self) -> int:
+
+        corpus = {file.name: (file, file_hash) for file, file_hash in self.corpus().items()}
+
+        stale_ids = []
+        new_docs = []
+        changed_files = 0
+
+        # ------ deleted files -------------------------------
+
+        for name in list(self.indexed_files):
+            if name not in corpus:
+                stale_ids.extend(self.indexed_files.pop(name)["chunks"])
+                changed_files += 1
+                logger.info(f"Source removed: {name}")
+
+        # ------ new / changed files -------------------------
+
+        changed = {
+            file: file_hash
+            for name, (file, file_hash) in corpus.items()
+            if self.indexed_files.get(name, {}).get("hash") != file_hash
+        }
+
+        for file, file_hash, file_docs in self.chunk_files(changed):
+
+            name = file.name
+            indexed = self.indexed_files.get(name)
+
+            if file_docs is None:
+                continue  # keep the previously indexed version
+
+            old_ids = set(indexed["chunks"]) if indexed else set()
+            new_ids = [doc.metadata["chunk_id"] for doc in file_docs]
+
+            stale_ids.extend(old_ids - set(new_ids))
+            new_docs.extend(doc for doc in file_docs if doc.metadata["chunk_id"] not in old_ids)
+
+            self.indexed_files[name] = {"hash": file_hash, "chunks": new_ids}
+            changed_files += 1
+            logger.info(f"Source {'changed' if indexed else 'added'}: {name}")
+
+        # ------ apply to index ------------------------------
+
+        if not changed_files:
+            return 0
+
+        # trained / graph indexes can't drop ids in place - rebuild (embedding cache keeps it cheap)
+        if config.rag_index_type != "flat":
+            logger.info(f"Corpus changed ({changed_files} files) - rebuilding {config.rag_index_type} index")
+            self.vstore = self.build()
+            return changed_files
+
+        live_ids = set(self.vstore.index_to_docstore_id.values())
+        stale_ids = [chunk_id for chunk_id in stale_ids if chunk_id in live_ids]
+
+        if stale_ids:
+            self.vstore.delete(stale_ids)
+
+        if new_docs:
+            self.index_documents(new_docs, self.vstore)
+
+        logger.info(f"Incremental index update: {changed_files} files, "
+                    f"{len(new_docs)} chunks embedded, {len(stale_ids)} chunks removed")
+
+        return changed_files
+
+    def index_documents(self, docs: Iterable[Document], vstore: FAISS | None = None) -> FAISS | None:
+
+        # batches are embedded concurrently and added to the index as each one completes
+        embedder = batch_embedder(self.embeddings)
+        received = []
+
+        def texts() -> Iterator[str]:
+            for doc in docs:
+                received.append(doc)
+                yield doc.page_content
+
+        for offset, vectors in embedder.run(texts()):
+
+            batch = received[offset:offset + len(vectors)]
+            text_embeddings = [(doc.page_content, vector) for doc, vector in zip(batch, vectors)]
+            metadatas = [doc.metadata for doc in batch]
+            ids = [doc.metadata["chunk_id"] for doc in batch]
+
+            if vstore is None:
+                vstore = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=ids)
+            else:
+                vstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+        self.build_stats = embedder.stats
+        return vstore
+
+    def save(self):
+
+        index_dir = Path(config.rag_index_dir)
+
+        manifest_file = index_dir / "manifest.json"
+
+        try:
+            index_dir.mkdir(parents=True, exist_ok=True)
+
+            # old manifest removed first, new one written last - a crash in between leaves no
+            # manifest (full rebuild), never an old file map next to a new index
+            manifest_file.unlink(missing_ok=True)
+            self.vstore.save_local(str(index_dir))
+
+            manifest = self.manifest()
+            manifest["files"] = self.indexed_files
+            manifest["num_vectors"] = self.vstore.index.ntotal
+            manifest["built_at"] = datetime.now().isoformat()
+
+            tmp_file = index_dir / "manifest.json.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, manifest_file)
+
+            logger.info(f"FAISS index saved to {index_dir} ({manifest['num_vectors']} vectors)")
+
+        except Exception as e:
+            logger.error(f"Failed to save FAISS index: {str(e)}")
+
+    def load(self):
+
+        if not self.corpus():
+            return None
+
+        index_dir = Path(config.rag_index_dir)
+        manifest_file = index_dir / "manifest.json"
+
+        try:
+            if not manifest_file.exists():
+                logger.info("No persisted FAISS index found - building")
+                return None
+
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+
+            # ------ incompatible index (model / chunking changed) ----
+
+            manifest = self.manifest()
+            stale = [key for key in manifest if stored.get(key) != manifest[key]]
+            if stale:
+                logger.info(f"Persisted FAISS index is stale ({', '.join(stale)} changed) - rebuilding")
+                return None
+
+            # the index dir is written only by this server, so pickle is trusted
+            vstore = FAISS.load_local(
+                str(index_dir),
+                self.embeddings,
+                allow_dangerous_deserialization=True
+            )
+
+            configure(vstore.index)
+            self.indexed_files = stored.get("files", {})
+
+            logger.info(f"Loaded persisted FAISS index built at {stored.get('built_at')}")
+            return vstore
+
+        except Exception as e:
+            logger.error(f"Failed to load persisted FAISS index: {str(e)}")
+            return None
+
+    def search(self, query: str, k: int = 4, filters: Dict | None = None) -> Dict:
         
         start_time = time.time()
         
         # ------ cache check -----------------------
             
+        scope = tuple(sorted((filters or {}).items()))
         query_hash = hashlib.md5(query.encode()).hexdigest()
-        cache_key = f"{query_hash}_{k}"
+        cache_key = f"{query_hash}_{k}_{scope}"
         
-        if cache_key in self.cache:
-            self.cache_hits += 1
+        cached_result = self.cache.get(cache_key)
+
+        if cached_result is not None:
             logger.info(f"Cache hit for query: {query[:50]}...")
-            cached_result = self.cache[cache_key]
             cached_result["metadata"]["from_cache"] = True
             return cached_result
         
-        self.cache_misses += 1
-        
         # ------ similarity search ------------------
             
         try:
-            results = self.vstore.similarity_search_with_score(query, k=k)
+            query_vector = self.try_embed(query)
+
+            # ------ semantic cache (paraphrased question) ----
+
+            semantic_hit = self.semantic_cache.get(query_vector, (scope, k)) if query_vector is not None else None
+
+            if semantic_hit is not None:
+                cached_result, similarity = semantic_hit
+                logger.info(f"Semantic cache hit for query: {query[:50]}... (similarity: {similarity:.3f})")
+                cached_result["metadata"]["from_cache"] = True
+                cached_result["metadata"]["semantic_similarity"] = similarity
+                self.cache.put(cache_key, cached_result)
+                return cached_result
+
+            allowed = self.allowed_ids(filters)
+            fetch_k = k * config.rag_hybrid_fetch if config.rag_hybrid else k
+
+            lexical_hits = []
+
+            if query_vector is None:
+
+                # ------ degraded: lexical ranking only ------
+                # BM25 score mapped into (0, 1] so it still reads as a distance
+                lexical_hits = self.bm25.search(query, k=k, allowed=allowed)
+                hits = [(i, 1.0 / (1.0 + score)) for i, score in lexical_hits]
+
+            else:
+                hits = self.vector_search(query_vector, k=fetch_k, allowed=allowed)
+
+            # ------ hybrid: BM25 over the same candidates ----
+
+            if config.rag_hybrid and query_vector is not None:
+                lexical_hits = self.bm25.search(query, k=fetch_k, allowed=allowed)
+                hits = self.fuse(hits, lexical_hits, query_vector, k)
+
+            results = [
+                (self.vstore.docstore.search(self.vstore.index_to_docstore_id[i]), distance)
+                for i, distance in hits[:k]
+            ]
         
         except Exception as e:
 
@@ -171,6 +376,10 @@ class RAG:
             "retrieval_time_ms": retrieval_time * 1000,
             "top_score": min(scores) if scores else None,  # FAISS uses L2 distance
             "from_cache": False,
+            "filters": filters or {},
+            "k": k,
+            "lexical_hits": len(lexical_hits),
+            "degraded": query_vector is None,
             "results_preview": [
                 {
                     "content": d[:200] + "..." if len(d) > 200 else d,
@@ -190,125 +399,332 @@ class RAG:
         result = {
             "documents": docs,
             "scores": scores,
+            "doc_metadata": doc_metadata,
             "metadata": search_record
         }
 
         # ------ updates -----------------------
 
         # tracking tokens
-        self.search_history.append(search_record)
+        self.search_history.record(search_record)
         self.search_count += 1
         
-        # caching (max 1000)
+        # caching (LRU + TTL, bounded by entries and bytes)
 
-        self.cache[cache_key] = result
-        
-        if len(self.cache) > 1000:
-            oldest_keys = list(self.cache.keys())[:100]
-            for key in oldest_keys:
-                del self.cache[key]
+        # degraded results are not cached - the next call retries the embedding
+        if query_vector is not None:
+            self.cache.put(cache_key, result)
+            self.semantic_cache.put(query_vector, (scope, k), result)
         
         return result
 
+    def vector_search(self, query_vector: List[float], k: int, allowed: set | None = None) -> List[Tuple[int, float]]:
+
+        index = self.vstore.index
+        vector = np.array([query_vector], dtype=np.float32)
+
+        # ------ pre-filter inside the index (id allow-list) ------
+
+        if allowed is None:
+            distances, indices = index.search(vector, k)
+        else:
+            selector = faiss.IDSelectorBatch(np.fromiter(allowed, dtype=np.int64))
+            distances, indices = index.search(vector, k, params=search_params(index, selector))
+
+        return [(int(i), float(distance)) for distance, i in zip(distances[0], indices[0]) if i != -1]
+
+    def fuse(self, vector_hits: List[Tuple[int, float]], lexical_hits: List[Tuple[int, float]],
+             query_vector: List[float], k: int) -> List[Tuple[int, float]]:
+
+        # ------ reciprocal rank fusion ------------------------
+
+        fused = {}
+        for hits in (vector_hits, lexical_hits):
+            for rank, (i, _) in enumerate(hits):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (config.rag_rrf_k + rank + 1)
+
+        top = sorted(fused, key=fused.get, reverse=True)[:k]
+
+        # ------ keep L2 distances as the reported score -------
+
+        distances = dict(vector_hits)
+        missing = [i for i in top if i not in distances]
+
+        if missing:
+            vectors = np.vstack([self.vstore.index.reconstruct(i) for i in missing])
+            query = np.asarray(query_vector, dtype=np.float32)
+            for i, vector in zip(missing, vectors):
+                distances[i] = float(np.sum((vector - query) ** 2))
+
+        return [(i, distances[i]) for i in top]
+
+    def allowed_ids(self, filters: Dict | None) -> set | None:
+
+        allowed = None
+
+        for field, value in (filters or {}).items():
+
+            value = canonical(field, value)
+            if value is None:
+                continue  # unknown value - don't filter on it
+
+            # chunks tagged with the value, plus chunks not specific to any value
+            ids = self.partitions.get((field, value), set()) | self.partitions.get((field, None), set())
+            allowed = ids if allowed is None else allowed & ids
+
+        if allowed is not None and not allowed:
+            logger.warning(f"No chunks match filters {filters} - searching the whole index")
+            return None
+
+        return allowed
+
+    def partition(self, documents: Dict[int, Document]) -> Dict:
+
+        # (field, value) -> faiss ids; value None = chunk not specific to that field
+        partitions = {}
+
+        for i, doc in documents.items():
+
+            metadata = doc.metadata
+
+            keys = [("category", metadata.get("category"))]
+            keys += [("hmo", hmo) for hmo in metadata.get("hmos") or [None]]
+            keys += [("tier", tier) for tier in metadata.get("tiers") or [None]]
+
+            for key in keys:
+                partitions.setdefault(key, set()).add(i)
+
+        return partitions
+
+    def documents(self) -> Dict[int, Document]:
+
+        return {
+            i: self.vstore.docstore.search(doc_id)
+            for i, doc_id in self.vstore.index_to_docstore_id.items()
+        }
+
+    def embed(self, query: str) -> List[float]:
+
+        # bounded wait - a slow remote endpoint must not hold the request
+        future = self.embed_pool.submit(self.embeddings.embed_query, query)
+        return future.result(timeout=config.rag_embedding_timeout)
+
+    def try_embed(self, query: str) -> List[float] | None:
+
+        try:
+            return self.embed(query)
+        except Exception as e:
+            if not config.rag_degraded_mode:
+                raise
+            logger.warning(f"Query embedding unavailable, degraded mode: {type(e).__name__}: {e}")
+            return None
+
     # ------------- helpers -------------------------------------------
 
-    def parse_html(self):
-        
-        doc_count = 0
-        
-        for file in Path("./Data/phase2_data").glob("*.html"):
-            try:
-                hmo = file.stem
-                
-                with open(file, 'r', encoding='utf-8') as f:
-                    soup = BeautifulSoup(f.read(), "lxml")
-                
-                sections = []
-
-                # ------- Remove : script / style --------------------------------------
-
-                for script in soup(["script", "style"]):
-                    script.decompose()
-
-                # ------- Divide : headers --------------------------------------
-
-                for header in soup.find_all(['h1', 'h2', 'h3', 'h4']):
-                    
-                    section_title = header.get_text(strip=True)
-                    content = []
-                    
-                    for sibling in header.find_next_siblings():
-                        if sibling.name in ['h1', 'h2', 'h3', 'h4']:
-                            break
-                        text = sibling.get_text(strip=True)
-                        if text:
-                            content.append(text)
-                    
-                    if content:
-                        section_text = f"[כותרת: {section_title}] {' '.join(content)}"
-                        sections.append(f"[קופת חולים: {hmo}] {section_text}")
-                
-                # ------- Divide : paragraph (if no headers) ---------------------
-
-                if not sections:
-                    for p in soup.find_all('p'):
-                        text = p.get_text(strip=True)
-                        if text and len(text) > 20:  # Skip very short paragraphs
-                            sections.append(f"[קופת חולים: {hmo}] {text}")
-                
-                # ------- Get all Text (no paragraphs) ----------------------------
-
-                if not sections:
-                    text = soup.get_text(separator=' ', strip=True)
-                    text = re.sub(r'\s+', ' ', text)
-                    if text:
-                        sections.append(f"[קופת חולים: {hmo}] {text}")
-                
-                doc_count += 1
-
-                logger.info(f"Processed {hmo}: {len(sections)} sections")
-                
-                for section in sections:
-                    yield section
-                    
-            except Exception as e:
-                logger.error(f"Error processing {file}: {str(e)}")
+    def manifest(self) -> Dict:
+
+        return {
+            "chunk_schema": CHUNK_SCHEMA,
+            "embedding_model": embedding_model(),
+            "chunk_size": config.rag_chunk_size,
+            "chunk_overlap": config.rag_chunk_overlap,
+            "index": index_spec(),
+        }
+
+    def corpus(self) -> Dict:
+
+        # ---- content hash per source file -------------------------
+
+        files = {}
+
+        for file in sorted(Path(config.rag_data_dir).glob("*.html")):
+            with open(file, 'rb') as f:
+                files[file] = hashlib.sha256(f.read()).hexdigest()
+
+        return files
+
+    def chunk_files(self, files: Dict) -> Iterator[Tuple[Path, str, List[Document] | None]]:
+
+        # ---- parallel parse + chunk, per-file timing ---------------
+
+        start = time.time()
+        per_file = {}
+
+        for file, docs, timing in chunk_files(list(files)):
+
+            per_file[file.name] = timing
+            logger.info(f"Processed {file.stem}: {timing.get('sections', 0)} sections, "
+                        f"{timing.get('records', 0)} benefit records, {timing.get('chunks', 0)} chunks "
+                        f"(parse {timing.get('parse_ms', 0)} ms, chunk {timing.get('chunk_ms', 0)} ms)")
+
+            yield file, files[file], docs
+
+        self.ingest_stats = {
+            "files": len(per_file),
+            "wall_ms": round((time.time() - start) * 1000, 2),
+            "per_file": per_file,
+        }
+
+    def prewarm(self, previous: "RAG"):
+
+        # replay the previous version's recent searches so the swap doesn't start on cold caches
+        replayed = set()
+
+        for record in reversed(previous.search_history.recent(config.rag_reload_prewarm)):
+
+            key = (record["query"], record.get("k"), tuple(sorted(record["filters"].items())))
+            if key in replayed or record.get("degraded"):
                 continue
-        
-        logger.info(f"Total documents processed: {doc_count}")
+
+            replayed.add(key)
+            self.search(record["query"], k=record.get("k", config.rag_top_k), filters=record["filters"] or None)
+
+        # search metrics continue across versions (the replay itself is not counted)
+        self.search_history = previous.search_history
+        self.search_count = previous.search_count
+
+        logger.info(f"Prewarmed {len(replayed)} recent searches")
 
     def get_cache_stats(self) -> Dict:
         
-        total_requests = self.cache_hits + self.cache_misses
-        hit_rate = self.cache_hits / total_requests if total_requests > 0 else 0
+        cache_stats = self.cache.stats()
         
-        # ---- avg retrieval time ----------------------------
+        # ---- running aggregates (no history scan) -----------
 
-        retrieval_times = [
-            s["retrieval_time_ms"] 
-            for s in self.search_history 
-            if not s.get("from_cache", False)
-        ]
-        avg_retrieval_ms = sum(retrieval_times) / len(retrieval_times) if retrieval_times else 0
-        
-        # ---- poor retrievals ----------------------------
+        search_stats = self.search_history.summary()
 
-        poor_quality_count = sum(
-            1 for s in self.search_history 
-            if s.get("avg_similarity_score", 0) > 1.0
-        )
-        
         return {
-            "cache_size": len(self.cache),
-            "cache_hits": self.cache_hits,
-            "cache_misses": self.cache_misses,
-            "hit_rate": hit_rate,
+            "cache_size": cache_stats["size"],
+            "cache_bytes": cache_stats["bytes"],
+            "cache_hits": cache_stats["hits"],
+            "cache_misses": cache_stats["misses"],
+            "cache_evictions": cache_stats["evictions"],
+            "cache_expirations": cache_stats["expirations"],
+            "hit_rate": cache_stats["hit_rate"],
             "total_searches": self.search_count,
-            "avg_retrieval_ms": avg_retrieval_ms,
-            "poor_quality_count": poor_quality_count,
-            "poor_quality_rate": poor_quality_count / self.search_count if self.search_count > 0 else 0
+            "avg_retrieval_ms": search_stats["avg_ms"],
+            "p50_retrieval_ms": search_stats["p50_ms"],
+            "p99_retrieval_ms": search_stats["p99_ms"],
+            "retrieval_latency_histogram": search_stats["latency_histogram"],
+            "poor_quality_count": search_stats["poor_quality_count"],
+            "poor_quality_rate": search_stats["poor_quality_rate"],
+            "degraded_searches": search_stats["degraded_count"],
+            "semantic_cache": self.semantic_cache.stats(),
+            "index_build": self.build_stats,
+            "ingest": self.ingest_stats,
         }
 
-# ------------- initialize rag --------------------------------------
+# ------------- chain retriever --------------------------------------
+
+class RAGRetriever(BaseRetriever):
+
+    k: int = 4
+    filters: dict = {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+
+        # single retrieval per turn - cached, tracked, and reused for citations
+        result = get().search(query, k=self.k, filters=self.filters)
+
+        return [
+            Document(page_content=doc, metadata={**metadata, "score": score})
+            for doc, score, metadata in zip(
+                result["documents"],
+                result["scores"],
+                result.get("doc_metadata", [])
+            )
+        ]
+
+# ------------- initialize rag (background) -------------------------
+
+class RAGNotReady(RuntimeError):
+    pass
+
+rag: RAG | None = None
+status = {"state": "idle", "error": None, "started_at": None, "ready_at": None,
+          "version": 0, "reloading": False, "reloaded_at": None, "reload_error": None}
+ready = threading.Event()
+init_lock = threading.Lock()
+on_reload = []  # callbacks(new_rag) run after a swap with changed content
+
+def start():
+
+    # idempotent - the app calls it on startup, get() on first use
+    with init_lock:
+        if status["state"] in ("warming", "ready"):
+            return
+        status.update(state="warming", error=None, started_at=datetime.now().isoformat())
+
+    threading.Thread(target=warm, name="rag-warmup", daemon=True).start()
+
+def warm():
+
+    global rag
+
+    try:
+        start_time = time.time()
+        rag = RAG()
+        status.update(state="ready", ready_at=datetime.now().isoformat(), version=1)
+        ready.set()
+        logger.info(f"RAG ready in {time.time() - start_time:.1f}s")
+
+    except Exception as e:
+        status.update(state="failed", error=str(e))
+        logger.error(f"RAG initialization failed: {str(e)}", exc_info=True)
+
+def get(timeout: float | None = None) -> RAG:
+
+    if rag is not None:
+        return rag
+
+    start()
+
+    if not ready.wait(timeout) or rag is None:
+        raise RAGNotReady(f"RAG index is {status['state']}")
+
+    return rag
+
+# ------------- hot swap --------------------------------------------
+
+def reload() -> bool:
+
+    # False when there is nothing to swap yet, or a reload is already running
+    with init_lock:
+        if rag is None or status["reloading"]:
+            return False
+        status.update(reloading=True, reload_error=None)
+
+    threading.Thread(target=swap, name="rag-reload", daemon=True).start()
+    return True
+
+def swap():
+
+    global rag
+
+    try:
+        start_time = time.time()
+        previous = rag
+
+        # built next to the live version - searches keep running on `previous`
+        new_rag = RAG()
+        new_rag.prewarm(previous)
+
+        # single reference assignment - in-flight searches finish on the old object,
+        # session chains resolve the retriever through get() and pick up the new one
+        with init_lock:
+            rag = new_rag
+            status.update(version=status["version"] + 1, reloaded_at=datetime.now().isoformat())
+
+        if new_rag.content_changed:
+            for callback in on_reload:
+                callback(new_rag)
+
+        logger.info(f"RAG reloaded (version {status['version']}, {new_rag.vstore.index.ntotal} vectors) "
+                    f"in {time.time() - start_time:.1f}s")
+
+    except Exception as e:
+        status.update(reload_error=str(e))
+        logger.error(f"RAG reload failed, keeping version {status['version']}: {str(e)}", exc_info=True)
 
-rag = RAG()
\ No newline at end of file
+    finally:
+        status.update(reloading=False)
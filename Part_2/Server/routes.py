@@ -1,14 +1,22 @@
 from fastapi import APIRouter, HTTPException, Header
+from fastapi import Request as HTTPRequest
+from fastapi.responses import StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime
 from pathlib import Path
+import asyncio
 import json
 import time
 import sys
 
 from schemas import Request, Response
+from streaming import TokenStream, sse
+from context import context_stats
 from services import (
     collect, verify, validate_input, get_qa_chain, cleanup_old_sessions,
-    session_chains, session_last_access, token_usage
+    save_session, sessions, token_usage, answer_cache, open_conversation, close_conversation,
+    collection_stats, collect_cascade, verify_cascade
 )
 import rag
 from Core.logger_setup import get_logger
@@ -22,21 +30,75 @@ logger = get_logger(__name__)
 
 router = APIRouter()
 
+# ------------- blocking work (LLM / retrieval) ----------------------
+
+# bounded - at most chat_workers Azure calls in flight per server worker
+chat_executor = ThreadPoolExecutor(max_workers=config.chat_workers, thread_name_prefix="chat")
+
+class ClientDisconnected(Exception):
+    pass
+
+async def watch_disconnect(http_request: HTTPRequest):
+
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(config.chat_disconnect_poll)
+
+async def run_blocking(http_request: HTTPRequest, func, *args):
+
+    # off the event loop, with a deadline, abandoned when the client goes away
+    work = asyncio.get_running_loop().run_in_executor(chat_executor, partial(func, *args))
+    watcher = asyncio.create_task(watch_disconnect(http_request))
+
+    try:
+        done, _ = await asyncio.wait({work, watcher}, timeout=config.chat_timeout, return_when=asyncio.FIRST_COMPLETED)
+
+        if work in done:
+            return work.result()
+
+        # still queued - never starts; already running - its result is dropped
+        work.cancel()
+
+        if watcher in done:
+            raise ClientDisconnected()
+        raise asyncio.TimeoutError()
+
+    finally:
+        watcher.cancel()
+
+def clean_sessions():
+
+    # COUNT / DELETE on the SQLite store - called through asyncio.to_thread, never on the loop
+    if len(sessions) > 50:
+        cleanup_old_sessions()
+
 # ------------- health route ----------------------------------------
 
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
-        "status": "healthy",
-        "active_sessions": len(session_chains),
+        "status": rag.status["state"],  # idle / warming / ready / failed
+        "rag": rag.status,
+        "active_sessions": await asyncio.to_thread(len, sessions),
         "timestamp": datetime.now().isoformat()
     }
 
 # ------------- main route ------------------------------------------
 
 @router.post("/chat", response_model=Response)
-async def chat(req: Request):
+async def chat(req: Request, http_request: HTTPRequest):
+
+    # --- session-token mode: server-side transcript ----------------
+
+    if req.session_id is None:
+        return await handle(req, http_request)
+
+    req = await asyncio.to_thread(open_conversation, req)
+    response = await handle(req, http_request)
+
+    return await asyncio.to_thread(close_conversation, req, response)
+
+async def handle(req: Request, http_request: HTTPRequest) -> Response:
     
     try:
         
@@ -52,96 +114,262 @@ async def chat(req: Request):
         
         # --- clean sessions -------------------------------------------
 
-        if len(session_chains) > 50:
-            cleanup_old_sessions()
-        
-        # ---------- phase 1 : collection ------------------------------
-        
-        if not req.user_info:
-            
-            assistant, info = collect(req.history, req.user_msg)
-            
-            return Response(assistant_msg=assistant, user_info=info)
+        await asyncio.to_thread(clean_sessions)
+
+        # --- phases run in the chat executor ---------------------------
+
+        return await run_blocking(http_request, respond, req)
+
+    except asyncio.TimeoutError:
+        logger.error(f"Chat request from {user_id} timed out after {config.chat_timeout}s")
+        return Response(assistant_msg=config.chatbot_timeout_message, user_info=req.user_info)
+
+    except ClientDisconnected:
+        logger.info(f"Client disconnected, request from {user_id} abandoned")
+        return Response(assistant_msg="", user_info=req.user_info)
+
+    except Exception as e:
+        logger.error(f"Error in chat endpoint: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="שגיאת שרת פנימית")
+
+def respond(req: Request, on_token=None) -> Response:
+
+    # ---------- phase 1 : collection ------------------------------
+    
+    if not req.user_info:
         
-        # ---------- phase 1.5 : verification --------------------------
+        assistant, info = collect(req.history, req.user_msg)
         
-        elif req.user_info and not req.user_info.get("verified", False):
+        return Response(assistant_msg=assistant, user_info=info)
+    
+    # ---------- phase 1.5 : verification --------------------------
+    
+    elif req.user_info and not req.user_info.get("verified", False):
 
-            assistant, updated_info, is_verified = verify(req.history, req.user_msg, req.user_info)
+        assistant, updated_info, is_verified = verify(req.history, req.user_msg, req.user_info)
+        
+        if is_verified:
+            updated_info["verified"] = True
             
-            if is_verified:
-                updated_info["verified"] = True
-                
-            return Response(assistant_msg=assistant, user_info=updated_info)
+        return Response(assistant_msg=assistant, user_info=updated_info)
+
+    # ---------- phase 2 : QA --------------------------------------
+    
+    return answer_question(req, on_token)
+
+def answer_question(req: Request, on_token=None) -> Response:
+
+    
+    # ----- get session ID --------------------------
+
+    session_id = req.user_info.get("id_number", f"temp_{int(time.time())}")
+
+    # ----- index still loading -----------------------
+
+    try:
+        rag_index = rag.get(config.rag_ready_timeout)
+    except rag.RAGNotReady as e:
+        logger.warning(f"QA request from {session_id} while {e}")
+        return Response(assistant_msg=config.chatbot_warming_message, user_info=req.user_info)
+    
+    user_language = req.user_info.get("language", "he")
+    filters = {"hmo": req.user_info.get("hmo_name"), "tier": req.user_info.get("tier")}
+    scope = (req.user_info.get("hmo_name", ""), req.user_info.get("tier", ""))
+
+    # rebuilt from the stored memory - any worker can serve the session
+    qa_chain = get_qa_chain(session_id, filters)
+
+    # ----- fast path: benefits table lookup --------
+
+    lookup = rag_index.benefits.answer(
+        req.user_msg,
+        req.user_info.get("hmo_name"),
+        req.user_info.get("tier"),
+        user_language
+    ) if config.qa_fast_path else None
+
+    if lookup is not None:
+        citations_text = "\n\n**מקורות:**\n"
+
+        for i, record in enumerate(lookup["records"], 1):
+            citations_text += f"[{i}] {record['category']} (טבלת הטבות): {record['service']} / {record['hmo']} / {record['tier']}\n"
+
+        logger.info(f"Fast path answer for {session_id}: {lookup['records'][0]['service']}")
+        qa_chain.memory.save_context({"question": req.user_msg}, {"answer": lookup["answer"]})
+        save_session(session_id, qa_chain)
+        return Response(assistant_msg=lookup["answer"] + citations_text, user_info=req.user_info)
+
+    # ----- semantic answer cache -------------------
+    
+    # only history-free turns - later answers depend on the conversation
+    first_turn = not qa_chain.memory.chat_memory.messages
+
+    question_vector = rag_index.try_embed(req.user_msg) if first_turn else None
+
+    if question_vector is not None:
+        cached = answer_cache.get(question_vector, (*scope, user_language))
 
-        # ---------- phase 2 : QA --------------------------------------
+        if cached is not None:
+            cached_answer, similarity = cached
+            logger.info(f"Answer cache hit for {session_id} (similarity: {similarity:.3f})")
+            qa_chain.memory.save_context({"question": req.user_msg}, {"answer": cached_answer["answer"]})
+            save_session(session_id, qa_chain)
+            return Response(assistant_msg=cached_answer["final_answer"], user_info=req.user_info)
+    
+    # ----- run chain (single retrieval) ------------
+
+    user_context = json.dumps(req.user_info, ensure_ascii=False)
+
+    result = qa_chain({
+        "question": req.user_msg,
+        "user_info": user_context,
+        "hmo_name": req.user_info.get("hmo_name", "לא ידוע"),
+        "tier": req.user_info.get("tier", "לא ידוע"),
+        "language": "Hebrew" if user_language == "he" else "English"
+    }, callbacks=[TokenStream(on_token)] if on_token else None)
+    save_session(session_id, qa_chain)
+    
+    answer = result.get("answer", "מצטער, לא הצלחתי למצוא תשובה.")
+    source_docs = result.get("source_documents", [])
+
+    # Extract assistant_message if it's still in JSON format
+    try:
+        if answer.startswith('{') and answer.endswith('}'):
+            parsed_answer = json.loads(answer)
+            answer = parsed_answer.get("assistant_message", answer)
+    except json.JSONDecodeError:
+        pass  
+
+    # ----- format citations -----------------------
+
+    if source_docs:
+        citations_text = "\n\n**מקורות:**\n"
         
-        else:
+        # same documents the prompt was built from
+        for i, doc in enumerate(source_docs[:3], 1):
+            hmo = doc.metadata.get("hmo", "לא ידוע")
+            content_preview = doc.page_content[:120] + "..." if len(doc.page_content) > 120 else doc.page_content
+            score = doc.metadata.get("score", 0)
             
-            # ----- get session ID --------------------------
+            citations_text += f"[{i}] {hmo} (רלוונטיות: {score:.2f}): {content_preview}\n"
         
-            session_id = req.user_info.get("id_number", f"temp_{int(time.time())}")
-            
-            if session_id not in session_chains:
-                session_chains[session_id] = get_qa_chain(session_id)
-                logger.info(f"Created new session for {session_id}")
-            
-            session_last_access[session_id] = time.time()
-            
-            # ----- perform retrieval -----------------------
-            
-            user_language = req.user_info.get("language", "he")
-            retrieved_docs = rag.rag.search(req.user_msg, k=4)
-            user_context = json.dumps(req.user_info, ensure_ascii=False)
-            
-            # ----- run chain -------------------------------
-        
-            qa_chain = session_chains[session_id]
-            result = qa_chain({
-                "question": req.user_msg,
-                "user_info": user_context,
-                "hmo_name": req.user_info.get("hmo_name", "לא ידוע"),
-                "tier": req.user_info.get("tier", "לא ידוע"),
-                "json_format": config.chatbot_format_qa,
-                "language": "Hebrew" if user_language == "he" else "English"
-            })
-            
-            answer = result.get("answer", "מצטער, לא הצלחתי למצוא תשובה.")
-
-            # Extract assistant_message if it's still in JSON format
-            try:
-                if answer.startswith('{') and answer.endswith('}'):
-                    parsed_answer = json.loads(answer)
-                    answer = parsed_answer.get("assistant_message", answer)
-            except json.JSONDecodeError:
-                pass  
-
-            # ----- format citations -----------------------
-
-            if retrieved_docs["documents"]:
-                citations_text = "\n\n**מקורות:**\n"
-                
-                # Get metadata from RAG search results
-                rag_results = retrieved_docs.get("metadata", {}).get("results_preview", [])
-                
-                for i, doc_info in enumerate(rag_results[:3], 1):
-                    hmo = doc_info.get("metadata", {}).get("hmo", "לא ידוע")
-                    content_preview = doc_info.get("content", "")[:120] + "..." if len(doc_info.get("content", "")) > 120 else doc_info.get("content", "")
-                    score = doc_info.get("score", 0)
-                    
-                    citations_text += f"[{i}] {hmo} (רלוונטיות: {score:.2f}): {content_preview}\n"
-                
-                final_answer = answer + citations_text
-            else:
-                final_answer = answer + "\n\n**לא נמצאו מקורות תומכים**"
-            
-            logger.info(f"Retrieval quality - Avg score: {retrieved_docs['metadata']['avg_similarity_score']:.3f}")
-            
-            return Response(assistant_msg=final_answer, user_info=req.user_info)
-            
+        final_answer = answer + citations_text
+
+        avg_score = sum(doc.metadata.get("score", 0) for doc in source_docs) / len(source_docs)
+        logger.info(f"Retrieval quality - Avg score: {avg_score:.3f}")
+
+        if question_vector is not None:
+            answer_cache.put(question_vector, (*scope, user_language), {"answer": answer, "final_answer": final_answer})
+    else:
+        final_answer = answer + "\n\n**לא נמצאו מקורות תומכים**"
+    
+    return Response(assistant_msg=final_answer, user_info=req.user_info)
+
+# ------------- streaming route -------------------------------------
+
+@router.post("/chat/stream")
+async def chat_stream(req: Request, http_request: HTTPRequest):
+
+    # same phases as /chat - "token" events while the QA answer is generated,
+    # then one "done" event with the full message (citations included) and user_info
+    return StreamingResponse(
+        stream_events(req, http_request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def stream_events(req: Request, http_request: HTTPRequest):
+
+    # session-token mode - the transcript is loaded here and saved with the "done" event
+    session_mode = req.session_id is not None
+    if session_mode:
+        req = await asyncio.to_thread(open_conversation, req)
+
+    async def finish(response: Response) -> str:
+        if session_mode:
+            response = await asyncio.to_thread(close_conversation, req, response)
+        return sse("done", response.model_dump())
+
+    user_id = req.user_info.get("id_number") if req.user_info else "anonymous"
+
+    user_msg = validate_input(req.user_msg)
+    if user_msg != req.user_msg:
+        yield await finish(Response(assistant_msg=user_msg, user_info=req.user_info))
+        return
+
+    logger.info(f"Streaming request from {user_id}: {req.user_msg[:50]}...")
+
+    await asyncio.to_thread(clean_sessions)
+
+    # ------ tokens cross from the executor thread to the event loop ------
+
+    loop = asyncio.get_running_loop()
+    tokens = asyncio.Queue()
+    on_token = lambda text: loop.call_soon_threadsafe(tokens.put_nowait, text)
+
+    work = loop.run_in_executor(chat_executor, partial(respond, req, on_token))
+    deadline = loop.time() + config.chat_timeout
+    getter = None
+
+    try:
+
+        while True:
+
+            getter = getter or asyncio.ensure_future(tokens.get())
+            done, _ = await asyncio.wait({getter, work}, timeout=config.chat_disconnect_poll, return_when=asyncio.FIRST_COMPLETED)
+
+            if getter in done:
+                yield sse("token", {"text": getter.result()})
+                getter = None
+                continue
+
+            if work in done:
+                break
+
+            if await http_request.is_disconnected():
+                logger.info(f"Client disconnected, request from {user_id} abandoned")
+                return
+
+            if loop.time() > deadline:
+                logger.error(f"Chat request from {user_id} timed out after {config.chat_timeout}s")
+                yield await finish(Response(assistant_msg=config.chatbot_timeout_message, user_info=req.user_info))
+                return
+
+        # tokens are queued before the result is - nothing is left behind
+        while not tokens.empty():
+            yield sse("token", {"text": tokens.get_nowait()})
+
+        yield await finish(work.result())
+
     except Exception as e:
-        logger.error(f"Error in chat endpoint: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail="שגיאת שרת פנימית")
+        logger.error(f"Error in chat stream: {str(e)}", exc_info=True)
+        yield sse("error", {"detail": "שגיאת שרת פנימית"})
+
+    finally:
+        if getter is not None:
+            getter.cancel()
+        work.cancel()
+
+# ------------- admin routes ----------------------------------------
+
+@router.post("/admin/reload", status_code=202)
+async def reload_index(api_key: str = Header(None, alias="X-API-Key")):
+    """Build a new index version in the background and swap it in"""
+
+    if config.admin_api_key and api_key != config.admin_api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+    if rag.rag is None:
+        raise HTTPException(status_code=503, detail=f"RAG index is {rag.status['state']}")
+
+    started = rag.reload()
+    logger.info(f"Index reload {'started' if started else 'already running'}")
+
+    return {
+        "reload_started": started,
+        "rag": rag.status,
+        "timestamp": datetime.now().isoformat()
+    }
 
 # ------------- stats routes ----------------------------------------
 
@@ -150,16 +378,24 @@ async def get_token_usage():
     """Get token usage statistics"""
     return {
         "token_usage": token_usage,
+        "context_savings": context_stats,
+        "collection_turns": collection_stats,
+        "cascade": {"collect": collect_cascade.summary(), "verify": verify_cascade.summary()},
         "timestamp": datetime.now().isoformat()
     }
 
 @router.get("/rag-stats")
 async def get_rag_stats():
+    rag_index = rag.rag
+    if rag_index is None:
+        raise HTTPException(status_code=503, detail=f"RAG index is {rag.status['state']}")
+
     try:
         return {
-            "search_count": rag.rag.search_count,
-            "cache_stats": rag.rag.get_cache_stats(),
-            "recent_searches": rag.rag.search_history[-10:] if hasattr(rag.rag, 'search_history') else []
+            "search_count": rag_index.search_count,
+            "cache_stats": rag_index.get_cache_stats(),
+            "answer_cache_stats": answer_cache.stats(),
+            "recent_searches": rag_index.search_history.recent(10)
         }
     except Exception as e:
         logger.error(f"Error getting RAG stats: {str(e)}")
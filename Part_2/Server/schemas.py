@@ -6,10 +6,13 @@ class Request(BaseModel):
     history: List[Dict[str, str]] = Field(default_factory=list)
     user_info: Dict[str, Any] | None = None
     user_msg: str
+    # session-token mode - history / user_info are kept by the server and ignored here
+    session_id: str | None = None
 
 class Response(BaseModel):
     assistant_msg: str
     user_info: Dict[str, Any] | None = None
+    session_id: str | None = None
 
 class UserInfoResponse(BaseModel):
     first_name: str = Field(description="שם פרטי")
@@ -1,16 +1,22 @@
 import re
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 from langchain_openai import AzureChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferWindowMemory
-from langchain.prompts import PromptTemplate
-import time
+from langchain_core.messages import messages_from_dict, messages_to_dict
+import secrets
 import json
 
 from Core import config
 from Core.logger_setup import get_logger
-from schemas import UserInfoResponse, VerificationResponse
+from schemas import Request, Response, UserInfoResponse, VerificationResponse
+from cache import SemanticCache
+from Common.cascade import Cascade
+from sessions import create_session_store
+from context import bound_history
+from lexical import canonical
+from prompts import LANGUAGE_INSTRUCTIONS, QA, collection_messages, verification_messages
 import rag
 
 # ------------- logger ----------------------------------------------
@@ -35,9 +41,7 @@ def detect_language(text: str) -> str:
 
 def get_language_prompt(language: str) -> str:
     
-    if language == "he":
-        return "Answer in Hebrew only."
-    return "Answer in English only."
+    return LANGUAGE_INSTRUCTIONS.get(language, LANGUAGE_INSTRUCTIONS["en"])
 
 # ------------- GPT-4o (chatbot) -----------------------------------
 
@@ -49,6 +53,25 @@ llm = AzureChatOpenAI(
     temperature=0.3,
 )
 
+# larger deployment - only reached when the mini model's reply fails its checks
+llm_large = AzureChatOpenAI(
+    azure_endpoint=config.openai_endpoint,
+    api_key=config.openai_key,
+    deployment_name=config.openai_model,
+    api_version=config.openai_version,
+    temperature=0.3,
+)
+
+# same deployment, token streaming on - only the QA answer is streamed
+qa_llm = AzureChatOpenAI(
+    azure_endpoint=config.openai_endpoint,
+    api_key=config.openai_key,
+    deployment_name=config.openai_model_mini,
+    api_version=config.openai_version,
+    temperature=0.3,
+    streaming=True,
+)
+
 # ------------- parsers ---------------------------------------------
 
 collection_parser = PydanticOutputParser(pydantic_object=UserInfoResponse)
@@ -57,17 +80,32 @@ verification_parser = PydanticOutputParser(pydantic_object=VerificationResponse)
 # ------------- token tracking --------------------------------------
 
 token_usage = {
-    "gpt-4o-mini": {"prompt_tokens": 0, "completion_tokens": 0, "total_cost": 0},
+    "gpt-4o-mini": {"prompt_tokens": 0, "cached_prompt_tokens": 0, "uncached_prompt_tokens": 0, "completion_tokens": 0, "total_cost": 0},
+    "gpt-4o": {"prompt_tokens": 0, "cached_prompt_tokens": 0, "uncached_prompt_tokens": 0, "completion_tokens": 0, "total_cost": 0},
     "text-embedding-ada-002": {"total_tokens": 0, "total_cost": 0}
 }
 token_pricing = {
-    "gpt-4o-mini": {"prompt": 0.00015, "completion": 0.0006},
+    "gpt-4o-mini": {"prompt": 0.00015, "cached_prompt": 0.000075, "completion": 0.0006},
+    "gpt-4o": {"prompt": 0.0025, "cached_prompt": 0.00125, "completion": 0.01},
     "text-embedding-ada-002": 0.00001
 }
 
-session_chains = {}
-session_last_access = {}
-SESSION_TIMEOUT = 1800  # 30 min
+# conversation memory per ID number - chains are rebuilt from it on every request
+sessions = create_session_store()
+
+# session-token mode: transcript + phase state per session id
+conversations = create_session_store(table="conversations")
+
+# ------------- answer cache (paraphrased first questions) -----------
+
+answer_cache = SemanticCache(
+    threshold=config.semantic_cache_threshold,
+    max_entries=config.semantic_cache_max_entries,
+    ttl=config.semantic_cache_ttl
+)
+
+# answers were built from the previous content - drop them when it changes
+rag.on_reload.append(lambda new_rag: answer_cache.clear())
 
 # ------------- phase 1 - collection ----------------------------------
 
@@ -82,7 +120,7 @@ def validate_user_info(info: Dict[str, Any], required_fields) -> bool:
     # --- collection completion check --------------------------
 
     all_filled = all(
-        info.get(field) and str(info.get(field)).strip() 
+        info.get(field) is not None and str(info.get(field)).strip()  # age 0 is filled
         for field in required_fields
     )
                 
@@ -136,46 +174,218 @@ def validate_input(user_input: str) -> str:
     
     return user_input
 
+def track_usage(response, model: str = config.openai_model_mini) -> Dict | None:
+
+    # cached = prompt prefix tokens the provider served from its cache (billed at a discount)
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage")
+    if not isinstance(usage, dict) or not usage:
+        return None
+
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+
+    stats = token_usage[model]
+    pricing = token_pricing[model]
+
+    stats["prompt_tokens"] += prompt_tokens
+    stats["cached_prompt_tokens"] += cached_tokens
+    stats["uncached_prompt_tokens"] += prompt_tokens - cached_tokens
+    stats["completion_tokens"] += completion_tokens
+    stats["total_cost"] += (
+        (prompt_tokens - cached_tokens) / 1000 * pricing["prompt"]
+        + cached_tokens / 1000 * pricing["cached_prompt"]
+        + completion_tokens / 1000 * pricing["completion"]
+    )
+
+    logger.info(f"Token usage ({model}) - Prompt: {prompt_tokens} ({cached_tokens} cached), Completion: {completion_tokens}")
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "cached_tokens": cached_tokens}
+
+# ------------- model cascade (mini first, escalate on failed checks) --
+
+def json_reply(get_model, model: str):
+
+    # model looked up per call - tests / reloads may replace the module-level clients
+    def call(msgs):
+        response = get_model().invoke(msgs, response_format={"type": "json_object"})
+        return response, track_usage(response, model)
+
+    return call
+
+def reply_tiers():
+
+    return [
+        (config.openai_model_mini, json_reply(lambda: llm, config.openai_model_mini)),
+        (config.openai_model, json_reply(lambda: llm_large, config.openai_model)),
+    ]
+
+def collection_reply_ok(response) -> bool:
+
+    result = json.loads(response.content)
+    if not isinstance(result.get("assistant_message"), str):
+        return False
+
+    # claims to be complete - then the details must actually validate
+    return not result.get("collection_complete") or validate_user_info(result, config.user_info_required_fields)
+
+def verification_reply_ok(response) -> bool:
+
+    result = json.loads(response.content)
+    if not isinstance(result.get("assistant_message"), str):
+        return False
+
+    return not result.get("verified") or validate_user_info({**result, "collection_complete": True}, config.user_info_required_fields)
+
+collect_cascade = Cascade("collect", reply_tiers(), collection_reply_ok, token_pricing)
+verify_cascade = Cascade("verify", reply_tiers(), verification_reply_ok, token_pricing)
+
+# ------------- phase 1 - rule based slot filling -------------------
+
+NAME = re.compile(r"^[a-z\u05d0-\u05ea'\-]+$")
+PUNCTUATION = re.compile(r"[.,!?:;\"()]")
+FILLER_WORDS = {"קופת", "חולים", "מסלול", "רמת", "ביטוח", "אני", "בן", "בת", "שנים", "hmo", "tier", "insurance", "years", "old", "i'm"}
+
+collection_stats = {"rule_turns": 0, "llm_turns": 0}
+
+def asked_slot(assistant_msg: str) -> str | None:
+
+    # field asked about in the last question of an assistant message
+    questions = [q for q in re.split(r"(?<=[?!.\n])", assistant_msg) if "?" in q]
+    text = (questions[-1] if questions else assistant_msg).lower()
+
+    for slot, keywords in config.collection_slot_keywords.items():
+        if any(re.search(rf"(?<!\w)[הוב]?{re.escape(keyword)}(?!\w)", text) for keyword in keywords):
+            return slot
+
+    return None
+
+def parse_answer(text: str, asked: str | None, slots: Dict[str, Any]) -> Dict[str, Any] | None:
+
+    # unambiguous single answers only - None leaves the message to the LLM
+    clean = " ".join(PUNCTUATION.sub(" ", text).lower().split())
+
+    if not clean or clean in config.collection_greetings:
+        return {}
+
+    # ------ numbers: ID / card (9 digits), age ---------------
+
+    digits = re.sub(r"[\s\-]", "", clean)
+    if digits.isdigit() and len(digits) == 9:
+        if asked in ("id_number", "card_number"):
+            return {asked: digits}
+        missing = [slot for slot in ("id_number", "card_number") if slots.get(slot) is None]
+        return {missing[0]: digits} if len(missing) == 1 else None
+
+    words = [word for word in clean.split() if word not in FILLER_WORDS]
+
+    if len(words) == 1 and words[0].isdigit() and len(words[0]) <= 3 and int(words[0]) <= 120:
+        # the age only when it was asked (or nothing was, and it is still missing) - "12" for an ID is not an age
+        if asked == "age" or (asked is None and slots.get("age") is None):
+            return {"age": int(words[0])}
+        return None
+
+    # ------ closed vocabularies: HMO / tier / gender ------------
+
+    if len(words) == 1:
+        word = words[0]
+        for candidate in (word, word[1:]):  # "במכבי" -> "מכבי"
+            if canonical("hmo", candidate):
+                return {"hmo_name": canonical("hmo", candidate)}
+            if canonical("tier", candidate):
+                return {"tier": canonical("tier", candidate)}
+        if word in config.collection_genders:
+            return {"gender": config.collection_genders[word]}
+
+    # ------ names - only as the answer to a name question -------
+
+    name_words = text.strip().strip(".!").split()
+    if asked in ("first_name", "last_name") and 1 <= len(name_words) <= (1 if asked == "first_name" else 2):
+        if all(NAME.match(word.lower()) for word in name_words) and not any(
+            canonical("hmo", word) or canonical("tier", word)
+            or word.lower() in config.collection_genders or word.lower() in config.collection_non_names
+            for word in name_words
+        ):
+            return {asked: " ".join(name_words)}
+
+    return None
+
+def fill_slots(history, user_msg) -> Tuple[str, Dict[str, Any] | None] | None:
+
+    # replays the whole collection conversation - no partial state to keep between requests
+    messages = [*history, {"role": "user", "content": user_msg}]
+    slots = {}
+    asked = "first_name"  # the client greeting asks for it
+
+    for message in messages:
+
+        if message.get("role") == "assistant":
+            asked = asked_slot(message.get("content", ""))
+            continue
+
+        values = parse_answer(message.get("content", ""), asked, slots)
+        if values is None:
+            return None  # free text somewhere - the LLM sees the full conversation from here on
+        slots.update(values)
+
+    user_language = detect_language(" ".join(m.get("content", "") for m in messages if m.get("role") == "user"))
+
+    # ------ next question --------------------------------------
+
+    # "is None" - age 0 is a valid answer
+    missing = [slot for slot in config.collection_slots if slots.get(slot) is None]
+    if missing:
+        return config.collection_questions[user_language][missing[0]], None
+
+    # ------ complete - summary for approval --------------------
+
+    if not validate_user_info({**slots, "collection_complete": True}, config.user_info_required_fields):
+        return None
+
+    labels = config.collection_labels[user_language]
+    header, question = config.collection_summary[user_language]
+    summary = [f"{labels[slot]}: {slots[slot]}" for slot in config.collection_slots]
+
+    user_info = {k: v for k, v in slots.items() if k in config.user_info_required_fields}
+    user_info["language"] = user_language
+
+    return "\n\n".join([header, *summary, question]), user_info
+
 def collect(history, user_msg):
 
     logger.info(f"Starting collection phase for message: {user_msg[:50]}...")
+
+    # --- unambiguous answers: no model call ---------------------
+
+    filled = fill_slots(history, user_msg)
+    if filled is not None:
+        collection_stats["rule_turns"] += 1
+        logger.info("Collection turn answered by slot filler")
+        return filled
+
+    collection_stats["llm_turns"] += 1
     
     try:
 
         # --- invoke LLM --------------------------
         
         user_language = detect_language(user_msg)
-        language_instruction = get_language_prompt(user_language)
 
-        formatted_prompt = config.chatbot_system_collection.format(
-            info=config.chatbot_format_user_info
-        ) + f"\n\n{language_instruction}"
-        
-        logger.info("COLLECT prompt:\n%s", formatted_prompt)
+        # details given in older turns survive as a short summary
+        history, context = bound_history(history, "collection")
+        logger.info(f"Collection context: {context['sent_tokens']} tokens, {context['saved_tokens']} saved")
 
+        # static prompt (cached by the provider) first, conversation after it
         msgs = [
-            {"role": "system", "content": formatted_prompt},
+            *collection_messages(user_language),
             *history,
             {"role": "user", "content": user_msg},
         ]
 
-        response = llm.invoke(msgs, response_format={"type": "json_object"})
-        out = response.content
-
-        # --- track tokens --------------------------
+        # --- mini model, escalated if the reply fails its checks ---
 
-        if hasattr(response, 'response_metadata'):
-            usage = response.response_metadata.get('token_usage', {})
-            if usage:
-                token_usage["gpt-4o-mini"]["prompt_tokens"] += usage.get('prompt_tokens', 0)
-                token_usage["gpt-4o-mini"]["completion_tokens"] += usage.get('completion_tokens', 0)
-                
-                prompt_cost = (usage.get('prompt_tokens', 0) / 1000) * token_pricing["gpt-4o-mini"]["prompt"]
-                completion_cost = (usage.get('completion_tokens', 0) / 1000) * token_pricing["gpt-4o-mini"]["completion"]
-                token_usage["gpt-4o-mini"]["total_cost"] += prompt_cost + completion_cost
-                
-                logger.info(f"Token usage - Prompt: {usage.get('prompt_tokens', 0)}, Completion: {usage.get('completion_tokens', 0)}")
-                logger.info(f"Collection raw output: {out}")
+        response = collect_cascade.run(msgs)
+        out = response.content
+        logger.info(f"Collection raw output: {out}")
         
         # --- validate results --------------------------
         
@@ -205,25 +415,22 @@ def verify(history, user_msg, current_info):
 
         # --- invoke LLM ------------------------------------
 
-        current_info_str = json.dumps(current_info, ensure_ascii=False, indent=2)
-
         user_language = current_info.get("language", detect_language(user_msg))
-        language_instruction = get_language_prompt(user_language)
 
-        formatted_prompt = config.chatbot_system_verification.format(
-            current_info=current_info_str,
-            json_format=config.chatbot_format_user_info
-        ) + f"\n\n{language_instruction}"
-        
-        logger.info("VERIFY prompt:\n%s", formatted_prompt)
+        # current_info in the prompt already carries everything older turns established
+        history, context = bound_history(history, "verification", summary=False)
+        logger.info(f"Verification context: {context['sent_tokens']} tokens, {context['saved_tokens']} saved")
         
+        # static prompt first, then the user's details and the conversation
         msgs = [
-            {"role": "system", "content": formatted_prompt},
+            *verification_messages(user_language, current_info),
             *history,
             {"role": "user", "content": user_msg},
         ]
 
-        out = llm.invoke(msgs, response_format={"type": "json_object"}).content
+        response = verify_cascade.run(msgs)
+
+        out = response.content
         logger.info(f"Verification raw output: {out}")
         
         # --- verification check -----------------------------
@@ -256,7 +463,12 @@ def verify(history, user_msg, current_info):
     
 # ------------- phase 2 - Q and A -------------------------------------
 
-def get_qa_chain(session_id: str):
+def no_chat_history(chat_history) -> str:
+
+    # empty history string - the chain skips the condense-question LLM call
+    return ""
+
+def get_qa_chain(session_id: str, filters: Dict[str, Any] | None = None):
     
     memory = ConversationBufferWindowMemory(
         memory_key="chat_history",
@@ -264,43 +476,60 @@ def get_qa_chain(session_id: str):
         output_key="answer",
         input_key="question"  
     )
-    
-    
-    qa_prompt = PromptTemplate(
-        template=config.chatbot_system_qa,
-        input_variables=["context", "user_info", "question", "hmo_name", "tier"]
-    )
-   
 
+    state = sessions.get(session_id)
+    if state:
+        memory.chat_memory.messages = messages_from_dict(state["messages"])
     
+    # condensing runs only when there is prior QA history (or never, if disabled)
+    chain_kwargs = {} if config.qa_condense_question else {"get_chat_history": no_chat_history}
+
     return ConversationalRetrievalChain.from_llm(
-        llm,
-        rag.rag.vstore.as_retriever(search_kwargs={"k": 4}),
+        qa_llm,
+        rag.RAGRetriever(k=config.rag_top_k, filters=filters or {}),
         return_source_documents=True,
         memory=memory,
-        combine_docs_chain_kwargs={"prompt": qa_prompt}
+        condense_question_llm=llm,  # not streamed to the client
+        combine_docs_chain_kwargs={"prompt": QA},  # precompiled, static part first
+        **chain_kwargs
     )
 
-def cleanup_old_sessions():
-    
-    # --- find expired sessions -------------------------
+def save_session(session_id: str, qa_chain: ConversationalRetrievalChain):
 
-    current_time = time.time()
-    expired = [
-        sid for sid, last_access in session_last_access.items()
-        if current_time - last_access > config.session_timeout
-    ]
+    # only the turns the window memory can still see
+    memory = qa_chain.memory
+    messages = memory.chat_memory.messages[-2 * memory.k:]
+
+    sessions.put(session_id, {"messages": messages_to_dict(messages)})
+
+# ------------- server-side conversations -----------------------------
+
+def open_conversation(req: Request) -> Request:
+
+    # history and user_info (incl. "verified") come from the server, never from the client;
+    # an unknown / expired id starts a new conversation under a freshly issued id
+    state = conversations.get(req.session_id) if req.session_id else None
 
-    # --- delete expired sessions -------------------------
+    if state is None:
+        return req.model_copy(update={"session_id": secrets.token_urlsafe(16), "history": [], "user_info": None})
 
-    for sid in expired:
-        if sid in session_chains:
-            del session_chains[sid]
-        if sid in session_last_access:
-            del session_last_access[sid]
+    return req.model_copy(update={"history": state["history"], "user_info": state["user_info"]})
+
+def close_conversation(req: Request, response: Response) -> Response:
+
+    # an abandoned request (client gone) leaves no turn behind
+    turn = [{"role": "user", "content": req.user_msg}, {"role": "assistant", "content": response.assistant_msg}]
+    history = [*req.history, *(turn if response.assistant_msg else [])][-config.conversation_max_messages:]
+
+    conversations.put(req.session_id, {"history": history, "user_info": response.user_info})
+    return response.model_copy(update={"session_id": req.session_id})
+
+def cleanup_old_sessions():
+    
+    expired = sessions.expire() + conversations.expire()
     
     if expired:
-        logger.info(f"Cleaned up {len(expired)} expired sessions")
+        logger.info(f"Cleaned up {expired} expired sessions")
 
 
 # ------------- exports for routes ----------------------------------
@@ -311,8 +540,14 @@ __all__ = [
     'validate_input',
     'get_qa_chain',
     'cleanup_old_sessions',
-    'session_chains',
-    'session_last_access',
+    'save_session',
+    'sessions',
+    'open_conversation',
+    'close_conversation',
     'token_usage',
+    'collection_stats',
+    'collect_cascade',
+    'verify_cascade',
+    'answer_cache',
     'llm'
 ]
\ No newline at end of file
@@ -0,0 +1,135 @@
+from pathlib import Path
+from typing import Any, Dict
+import threading
+import sqlite3
+import json
+import time
+
+from Core import config
+from Core.logger_setup import get_logger
+from cache import LRUCache
+
+
+# ------------- logger ----------------------------------------------
+
+logger = get_logger(__name__)
+
+# ------------- stores ----------------------------------------------
+
+# a session is plain JSON (serialized QA memory, or a conversation transcript) - nothing live is stored
+
+class MemorySessionStore:
+
+    def __init__(self, capacity: int, ttl: float, max_bytes: int):
+
+        self.cache = LRUCache(max_entries=capacity, ttl=ttl, max_bytes=max_bytes)
+
+    def get(self, session_id: str) -> Dict | None:
+
+        return self.cache.get(session_id)
+
+    def put(self, session_id: str, state: Dict):
+
+        self.cache.put(session_id, state)
+
+    def delete(self, session_id: str):
+
+        self.cache.delete(session_id)
+
+    def expire(self) -> int:
+
+        return self.cache.expire()
+
+    def stats(self) -> Dict:
+
+        return {"backend": "memory", **self.cache.stats()}
+
+    def __len__(self) -> int:
+
+        return len(self.cache)
+
+class SQLiteSessionStore:
+
+    def __init__(self, path: str, capacity: int, ttl: float, table: str = "sessions"):
+
+        self.path = path
+        self.table = table
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        # one file shared by every worker process - WAL lets readers run alongside a writer
+        self.db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self.db.commit()
+
+    def get(self, session_id: str) -> Dict | None:
+
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT state FROM {self.table} WHERE session_id = ? AND last_access >= ?",
+                (session_id, time.time() - self.ttl)
+            ).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def put(self, session_id: str, state: Dict):
+
+        with self.lock, self.db:
+
+            self.db.execute(
+                f"INSERT INTO {self.table} (session_id, state, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, last_access = excluded.last_access",
+                (session_id, json.dumps(state, ensure_ascii=False), time.time())
+            )
+
+            # ------ least recently used beyond capacity ------
+
+            self.db.execute(
+                f"DELETE FROM {self.table} WHERE session_id IN ("
+                f"SELECT session_id FROM {self.table} ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.capacity,)
+            )
+
+    def delete(self, session_id: str):
+
+        with self.lock, self.db:
+            self.db.execute(f"DELETE FROM {self.table} WHERE session_id = ?", (session_id,))
+
+    def expire(self) -> int:
+
+        with self.lock, self.db:
+            return self.db.execute(
+                f"DELETE FROM {self.table} WHERE last_access < ?", (time.time() - self.ttl,)
+            ).rowcount
+
+    def stats(self) -> Dict:
+
+        return {"backend": "sqlite", "size": len(self), "path": self.path, "table": self.table}
+
+    def __len__(self) -> int:
+
+        with self.lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+# ------------- factory ---------------------------------------------
+
+def create_session_store(backend: str | None = None, table: str = "sessions") -> Any:
+
+    backend = backend or config.session_backend
+
+    if backend == "memory":
+        return MemorySessionStore(config.session_capacity, config.session_timeout, config.session_max_bytes)
+
+    if backend == "sqlite":
+        logger.info(f"Using SQLite session store: {config.session_db_path} ({table})")
+        return SQLiteSessionStore(config.session_db_path, config.session_capacity, config.session_timeout, table)
+
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,91 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from typing import Any, Callable, Dict
+import json
+import re
+
+
+# ------------- server-sent events ----------------------------------
+
+def sse(event: str, data: Dict) -> str:
+
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# ------------- streamed answer -------------------------------------
+
+class MessageStream:
+
+    # the QA answer is JSON - only the assistant_message value is shown while it streams
+    FIELD = re.compile(r'"assistant_message"\s*:\s*"')
+
+    def __init__(self):
+
+        self.buffer = ""
+        self.mode = "start"  # start / plain / field / value / end
+
+    def feed(self, token: str) -> str:
+
+        self.buffer += token
+
+        if self.mode == "start":
+            stripped = self.buffer.lstrip()
+            if not stripped:
+                return ""
+            self.mode = "field" if stripped[0] in "{`" else "plain"
+
+        if self.mode == "plain":
+            text, self.buffer = self.buffer, ""
+            return text
+
+        if self.mode == "field":
+            match = self.FIELD.search(self.buffer)
+            if not match:
+                return ""
+            self.buffer = self.buffer[match.end():]
+            self.mode = "value"
+
+        if self.mode == "value":
+            return self.decode()
+
+        return ""
+
+    def decode(self) -> str:
+
+        buffer, out, i = self.buffer, [], 0
+
+        while i < len(buffer):
+
+            char = buffer[i]
+
+            if char == '"':
+                self.mode = "end"
+                break
+
+            if char == "\\":
+                size = 6 if buffer[i + 1:i + 2] == "u" else 2
+                if size == 6 and len(buffer) >= i + 6 and 0xD800 <= int(buffer[i + 2:i + 6], 16) <= 0xDBFF:
+                    size = 12  # surrogate pair
+                if i + size > len(buffer):
+                    break  # incomplete escape - wait for the next token
+                out.append(json.loads(f'"{buffer[i:i + size]}"'))
+                i += size
+                continue
+
+            out.append(char)
+            i += 1
+
+        self.buffer = buffer[i:] if self.mode == "value" else ""
+        return "".join(out)
+
+class TokenStream(BaseCallbackHandler):
+
+    # runs in the chat executor thread - on_token must be thread safe
+    def __init__(self, on_token: Callable[[str], Any]):
+
+        self.on_token = on_token
+        self.message = MessageStream()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+
+        text = self.message.feed(token)
+        if text:
+            self.on_token(text)
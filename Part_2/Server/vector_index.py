@@ -0,0 +1,118 @@
+from typing import Dict
+import numpy as np
+import faiss
+import math
+
+from Core import config
+from Core.logger_setup import get_logger
+
+
+# ------------- logger ----------------------------------------------
+
+logger = get_logger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# ------------- build parameters ------------------------------------
+
+def index_spec(index_type: str | None = None) -> Dict:
+
+    # build-time parameters only - part of the manifest, a change forces a rebuild
+    index_type = index_type or config.rag_index_type
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    spec = {"type": index_type}
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        spec["nlist"] = config.rag_ivf_nlist
+    if index_type == "ivf_pq":
+        spec["pq_m"] = config.rag_pq_m
+        spec["pq_bits"] = config.rag_pq_bits
+    if index_type == "hnsw":
+        spec["hnsw_m"] = config.rag_hnsw_m
+        spec["ef_construction"] = config.rag_hnsw_ef_construction
+
+    return spec
+
+def ivf_nlist(n: int) -> int:
+
+    # ~4*sqrt(n) lists, but never fewer than ~39 training points per centroid
+    nlist = config.rag_ivf_nlist or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // 39))
+
+def pq_subquantizers(dim: int) -> int:
+
+    # largest m <= configured m that divides the dimension
+    m = min(config.rag_pq_m, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+# ------------- build -----------------------------------------------
+
+def build_index(vectors: np.ndarray, index_type: str | None = None) -> faiss.Index:
+
+    index_type = index_type or config.rag_index_type
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, config.rag_hnsw_m)
+        index.hnsw.efConstruction = config.rag_hnsw_ef_construction
+
+    elif index_type in ("ivf_flat", "ivf_pq"):
+
+        nlist = ivf_nlist(n)
+        quantizer = faiss.IndexFlatL2(dim)
+
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            # 2^bits centroids per sub-quantizer need at least as many training vectors
+            bits = max(1, min(config.rag_pq_bits, int(math.log2(n))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_subquantizers(dim), bits)
+
+        # ------ training during build ---------------
+        index.train(vectors)
+
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    # same insertion order - faiss ids stay aligned with the docstore mapping
+    index.add(vectors)
+    configure(index)
+
+    logger.info(f"Built {index_type} index: {n} vectors, {index_memory(index)} bytes")
+    return index
+
+def configure(index: faiss.Index) -> faiss.Index:
+
+    # search-time parameters - applied after build and after loading from disk
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(config.rag_ivf_nprobe, index.nlist)
+        index.make_direct_map()  # reconstruct() is used by hybrid fusion
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config.rag_hnsw_ef_search
+
+    return index
+
+# ------------- search ----------------------------------------------
+
+def search_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+
+    # per-type params - the generic struct would silently reset nprobe / efSearch
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+
+    return faiss.SearchParameters(sel=selector)
+
+def index_memory(index: faiss.Index) -> int:
+
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,157 @@
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directories to path
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "Server"))
+
+from Core import config
+
+DATA_DIR = str(Path(__file__).parent.parent.parent / "Data" / "phase2_data")
+
+QUERIES = [
+    "כמה עולה טיפול שורש במכבי?",
+    "הנחה על סתימות למסלול זהב",
+    "בדיקת ראייה לילדים",
+    "טיפול בגמגום",
+    "סדנאות הפסקת עישון",
+    "רפואה משלימה דיקור סיני",
+    "how much is a dental cleaning",
+    "מה כלול בהריון ולידה",
+]
+
+# ------------- benchmark ----------------------------------------------
+
+def percentile(values, q):
+
+    return float(np.percentile(values, q)) if values else 0.0
+
+def run(backend: str, rounds: int) -> dict:
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        config.rag_embedding_backend = backend
+        config.rag_data_dir = DATA_DIR
+        config.rag_index_dir = str(Path(tmp) / "index")
+        config.rag_embedding_cache = False
+
+        # built here, after the overrides (the module instance is only created by rag.start()) -
+        # construction indexes once, then a second, full build is timed
+        import rag as rag_module
+        store = rag_module.RAG()
+
+        # ------ indexing throughput ------------------
+
+        start = time.perf_counter()
+        store.vstore = store.build()
+        build_seconds = time.perf_counter() - start
+        chunks = store.vstore.index.ntotal
+
+        # ------ search latency (caches bypassed) -----
+
+        latencies = []
+        for _ in range(rounds):
+            for query in QUERIES:
+                store.cache.clear()
+                store.semantic_cache.clear()
+                start = time.perf_counter()
+                store.search(query, k=config.rag_top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "backend": backend,
+        "chunks": chunks,
+        "build_seconds": round(build_seconds, 3),
+        "chunks_per_second": round(chunks / build_seconds, 1) if build_seconds else None,
+        "searches": len(latencies),
+        "search_p50_ms": round(percentile(latencies, 50), 3),
+        "search_p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+def compare_indexes(backend: str, synthetic: int, k: int, num_queries: int) -> list:
+
+    from vector_index import INDEX_TYPES, build_index, index_memory
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        config.rag_embedding_backend = backend
+        config.rag_data_dir = DATA_DIR
+        config.rag_index_dir = str(Path(tmp) / "index")
+        config.rag_embedding_cache = False
+        config.rag_index_type = "flat"
+
+        import rag as rag_module
+        store = rag_module.RAG()
+
+        vectors = store.vstore.index.reconstruct_n(0, store.vstore.index.ntotal)
+        queries = np.array([store.embed(query) for query in QUERIES], dtype=np.float32)
+
+    # ------ synthetic growth: noisy copies of the real chunks ------
+
+    rng = np.random.default_rng(0)
+
+    def perturbed(n):
+        base = vectors[rng.integers(0, len(vectors), n)]
+        noisy = base + rng.normal(0, 0.05, base.shape).astype(np.float32)
+        return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+    if synthetic:
+        vectors = np.vstack([vectors, perturbed(synthetic)])
+    queries = np.vstack([queries, perturbed(num_queries)]).astype(np.float32)
+
+    # ------ exact baseline ------------------------------------
+
+    exact = build_index(vectors, "flat")
+    _, truth = exact.search(queries, k)
+
+    report = []
+
+    for index_type in INDEX_TYPES:
+
+        start = time.perf_counter()
+        index = build_index(vectors, index_type)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        found = []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            _, indices = index.search(query[np.newaxis, :], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(len(set(indices[0]) & set(expected)) / k)
+
+        report.append({
+            "index": index_type,
+            "vectors": len(vectors),
+            f"recall@{k}": round(float(np.mean(found)), 4),
+            "query_p50_ms": round(percentile(latencies, 50), 4),
+            "query_p99_ms": round(percentile(latencies, 99), 4),
+            "memory_bytes": index_memory(index),
+            "build_seconds": round(build_seconds, 3),
+        })
+
+    return report
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Offline indexing / search benchmark")
+    parser.add_argument("--backend", default="local", choices=["local", "azure"])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--indexes", action="store_true", help="compare index types against the flat baseline")
+    parser.add_argument("--synthetic", type=int, default=0, help="extra synthetic vectors (simulated corpus growth)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=config.rag_top_k)
+    args = parser.parse_args()
+
+    if args.indexes:
+        result = compare_indexes(args.backend, args.synthetic, args.k, args.queries)
+    else:
+        result = run(args.backend, args.rounds)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))